@@ -1,18 +1,32 @@
+from django import forms
 from django.contrib import admin
-from engage.models import Activity, Leaderboard, Team, Item, Notification, UserParticipated
+from engage.models import Activity, Leaderboard, Team, Item, Notification, Order, OrderLine, OutboundEmail, UserParticipated
+from engage.catalog import invalidate_catalog
+from engage.notifications import notify, notify_everyone
+from engage.points import adjust_points
 from .models import CustomUser, LoginToken
 
-class UserParticipatedInline(admin.TabularInline):
+# participations are only listed here: claims and reversals go through engage.attendance and
+# engage.points, which keep the points ledger, score rollups and team points in step
+class ReadOnlyParticipationInline(admin.TabularInline):
     model = UserParticipated
     extra = 0  # Number of extra forms to display
+    readonly_fields = ('date_participated',)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class UserParticipatedInline(ReadOnlyParticipationInline):
     fields = ('user', 'date_participated')  # Specify which fields to include
-    readonly_fields = ('date_participated',)  # Make date_participated read-only if desired
 
-class UserParticipatedInlineUser(admin.TabularInline):
-    model = UserParticipated
-    extra = 0  # Number of extra forms to display
+class UserParticipatedInlineUser(ReadOnlyParticipationInline):
     fields = ('activity', 'date_participated')  # Specify which fields to include
-    readonly_fields = ('date_participated',)  # Make date_participated read-only if desired
 class ActivityAdmin(admin.ModelAdmin):
     list_display = ('title', 'event_date', 'is_active')
     inlines = [UserParticipatedInline]
@@ -23,25 +37,92 @@ class LeaderboardAdmin(admin.ModelAdmin):
 class TeamAdmin(admin.ModelAdmin):
     list_display = ('name',)
 
+# item changes here have to reach the cached store catalog too
 class ItemAdmin(admin.ModelAdmin):
     list_display = ('name', 'price')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_catalog()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_catalog()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_catalog()
+
 # display logintoken with user email and date/time of creation
 class LoginTokenAdmin(admin.ModelAdmin):
     list_display = ('user_email', 'date_created', 'token')
     def user_email(self, obj):
         return obj.user.email
     
-class NotificationInline(admin.TabularInline):
-    model = Notification
-    extra = 0  # Number of extra forms to display
-    fields = ('title', 'created_at', 'read')  # Specify which fields to include
-    readonly_fields = ('title', 'created_at')  # Make created_at read-only if desired
-    
+# notifications get their own paginated list, an inline would render all of a user's rows
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('title', 'recipient', 'created_at', 'read')
+    list_filter = ('read',)
+    search_fields = ('title', 'recipient__email')
+    raw_id_fields = ('recipient',)
+    list_select_related = ('recipient',)
+
+    def save_model(self, request, obj, form, change):
+        # new notifications go out like any other, counted in the unread badge and pushed live
+        if change:
+            super().save_model(request, obj, form, change)
+            return
+        if obj.recipient:
+            notification = notify(obj.recipient, obj.title, obj.message)
+        else:
+            notification = notify_everyone(obj.title, obj.message)
+        obj.pk, obj.created_at = notification.pk, notification.created_at
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    fields = ('name', 'price', 'quantity')
+    readonly_fields = ('name', 'price', 'quantity')
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'total', 'created_at')
+    list_select_related = ('user',)
+    inlines = [OrderLineInline]
+
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+
+# points only move through the ledger, so staff enter a change to the balance instead of a new one
+class CustomUserAdminForm(forms.ModelForm):
+    points_adjustment = forms.IntegerField(
+        required=False, help_text="Points to add to the balance, negative to take points away."
+    )
+
+    class Meta:
+        model = CustomUser
+        fields = '__all__'
+
 # display customusers with user.str, date joined, balance, and whether they are a superuser
 class CustomUserAdmin(admin.ModelAdmin):
+    form = CustomUserAdminForm
     list_display = ('user_str', 'date_joined', 'balance', 'is_superuser')
-    inlines = [NotificationInline, UserParticipatedInlineUser]
+    inlines = [UserParticipatedInlineUser]
+    # points and the unread counter are maintained by engage.points and engage.notifications
+    readonly_fields = ('balance', 'lifetime_points', 'unread_notifications', 'notifications_seen_at')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # only the fields on the form are written, so points awarded or spent while it
+            # was open aren't overwritten with the values it was loaded with
+            obj.save(update_fields=[field.name for field in obj._meta.concrete_fields if field.name in form.fields])
+        else:
+            super().save_model(request, obj, form, change)
+        # the adjustment goes in the ledger and is added to the balance with F()
+        if form.cleaned_data.get('points_adjustment'):
+            adjust_points(obj, form.cleaned_data['points_adjustment'])
+            obj.refresh_from_db(fields=['balance'])
     def user_str(self, obj):
         return obj.__str__()
 
@@ -51,4 +132,7 @@ admin.site.register(LoginToken, LoginTokenAdmin)
 admin.site.register(Activity, ActivityAdmin)
 admin.site.register(Leaderboard, LeaderboardAdmin)
 admin.site.register(Team, TeamAdmin)
-admin.site.register(Item, ItemAdmin)
\ No newline at end of file
+admin.site.register(Item, ItemAdmin)
+admin.site.register(Notification, NotificationAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
+admin.site.register(Order, OrderAdmin)
\ No newline at end of file
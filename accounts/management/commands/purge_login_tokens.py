@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import LoginToken
+
+
+class Command(BaseCommand):
+    help = "Delete every expired or used login token"
+
+    def handle(self, *args, **options):
+        # tokens aren't deleted when they're used (link scanners follow them first), so
+        # they're cleared here in one DELETE
+        deleted, _ = LoginToken.objects.filter(Q(expiration_date__lt=timezone.now()) | Q(used=True)).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} login tokens"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_customuser_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='notifications_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_notifications(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Notification = apps.get_model('engage', 'Notification')
+    unread = (
+        Notification.objects.filter(recipient=OuterRef('pk'), read=False)
+        .values('recipient')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    CustomUser.objects.update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_notifications_seen_at'),
+        ('engage', '0011_notification_broadcasts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='unread_notifications',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_notifications, migrations.RunPython.noop),
+    ]
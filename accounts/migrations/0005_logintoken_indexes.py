@@ -0,0 +1,21 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_customuser_unread_notifications'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logintoken',
+            index=models.Index(fields=['expiration_date'], name='accounts_lo_expirat_3bab61_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logintoken',
+            index=models.Index(fields=['used'], name='accounts_lo_used_00eafe_idx'),
+        ),
+    ]
@@ -42,6 +42,11 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     lifetime_points = models.IntegerField(default=0)
     position = models.CharField(max_length=50, default="", blank=True)
     date_joined = models.DateTimeField(auto_now_add=True)
+    # broadcast notifications created after this are unread
+    notifications_seen_at = models.DateTimeField(null=True, blank=True)
+    # unread personal notifications, maintained by engage.notifications so the navbar badge
+    # doesn't count rows on every render
+    unread_notifications = models.IntegerField(default=0)
 
     objects = MyUserManager()
 
@@ -59,4 +64,8 @@ class LoginToken(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     # set expiration date to 15 minutes from now on creation
     expiration_date = models.DateTimeField(default=ten_minutes_from_now, null=False)
-    used = models.BooleanField(default=False)
\ No newline at end of file
+    used = models.BooleanField(default=False)
+
+    class Meta:
+        # purge_login_tokens filters on either column
+        indexes = [models.Index(fields=["expiration_date"]), models.Index(fields=["used"])]
\ No newline at end of file
@@ -1,3 +1,63 @@
 from django.test import TestCase
+from django.urls import reverse
+from engage.models import PointsTransaction, UserParticipated
+from engage.testing import make_activity, make_user, plain_static_files
+from .models import CustomUser
 
-# Create your tests here.
+
+@plain_static_files
+class UserAdminTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("admin@example.com", is_staff=True, is_superuser=True)
+        self.user = make_user("a@example.com", balance=50, lifetime_points=50)
+        self.client.force_login(self.admin)
+
+    def change_form(self, **fields):
+        response = self.client.get(reverse("admin:accounts_customuser_change", args=[self.user.pk]))
+        form = response.context["adminform"].form
+        # what the browser would post back for the unchanged form
+        data = {name: form[name].value() for name in form.fields if name not in ("groups", "user_permissions")}
+        data = {name: "" if value is None else value for name, value in data.items() if value is not False}
+        for formset in response.context["inline_admin_formsets"]:
+            management = formset.formset.management_form
+            data.update({management.add_prefix(name): management[name].value() for name in management.fields})
+        data.update(fields)
+        return data
+
+    def test_saving_keeps_points_awarded_while_the_form_was_open(self):
+        data = self.change_form(first_name="Renamed")
+        # a claim paid out in the meantime
+        CustomUser.objects.filter(pk=self.user.pk).update(balance=70, lifetime_points=70)
+        response = self.client.post(reverse("admin:accounts_customuser_change", args=[self.user.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.balance, self.user.lifetime_points), ("Renamed", 70, 70))
+
+    def test_saving_keeps_the_unread_counter(self):
+        data = self.change_form(first_name="Renamed")
+        self.assertNotIn("unread_notifications", data)
+        CustomUser.objects.filter(pk=self.user.pk).update(unread_notifications=3)
+        self.client.post(reverse("admin:accounts_customuser_change", args=[self.user.pk]), data)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notifications, 3)
+
+    def test_adjustment_goes_through_the_ledger(self):
+        data = self.change_form(points_adjustment="-30")
+        CustomUser.objects.filter(pk=self.user.pk).update(balance=70)
+        self.client.post(reverse("admin:accounts_customuser_change", args=[self.user.pk]), data)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.balance, self.user.lifetime_points), (40, 50))
+        self.assertEqual(list(PointsTransaction.objects.values_list("kind", "amount")), [(PointsTransaction.ADJUSTMENT, -30)])
+
+    def test_participations_cannot_be_added_or_removed_here(self):
+        activity = make_activity(self.admin)
+        participation = UserParticipated.objects.create(user=self.user, activity=activity)
+        other = make_activity(self.admin)
+        prefix = "userparticipated_set"
+        data = self.change_form(**{
+            f"{prefix}-TOTAL_FORMS": "2", f"{prefix}-INITIAL_FORMS": "1",
+            f"{prefix}-0-id": participation.pk, f"{prefix}-0-DELETE": "on",
+            f"{prefix}-1-activity": other.pk,
+        })
+        self.client.post(reverse("admin:accounts_customuser_change", args=[self.user.pk]), data)
+        self.assertEqual(list(UserParticipated.objects.values_list("pk", flat=True)), [participation.pk])
@@ -1,6 +1,6 @@
 import sys
 from django.shortcuts import render, redirect
-from django.core.mail import send_mail
+from engage.mail import queue_mail
 from django.contrib.sites.shortcuts import get_current_site
 from django.contrib.auth import login, logout
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
@@ -10,7 +10,6 @@ from django.template.loader import render_to_string
 from .models import LoginToken, CustomUser
 import cloudinary.uploader
 import uuid
-from django.db.models import Q
 
 def send_login_link(request):
     if request.user.is_authenticated:
@@ -39,7 +38,7 @@ def send_login_link(request):
             subject = 'Your Login Link'
             message = render_to_string('auth/login_link.html', {'login_link': login_link})
             from_email = 'noreply@engage.bogz.dev'
-            send_mail(subject, message, from_email, [email])
+            queue_mail(subject, message, from_email, [email])
             return render(request, 'auth/send_login_link.html',  {'success': 'An email with your login link has been sent to ' + email + '. Please check your inbox.'})
         else:
             return render(request, 'auth/register.html', {'error': 'User with email address ' + email + ' not found'})
@@ -120,7 +119,7 @@ def register(request):
         # Send the login link via email
         subject = 'Welcome! Use this link to log in'
         message = render_to_string('auth/login_link.html', {'login_link': login_link})
-        send_mail(subject, message, 'noreply@engage.bogz.dev', [email])
+        queue_mail(subject, message, 'noreply@engage.bogz.dev', [email])
 
         # Redirect to success message with hx-header
         return render(request, 'auth/email_sent.html')
@@ -130,12 +129,6 @@ def register(request):
         return render(request, 'auth/register.html')
 
 def logout_view(request):
-    # get all expired tokens and all used tokens
-    tokens_query = LoginToken.objects.filter(Q(expiration_date__lt=timezone.now()) | Q(used=True))
-    expired_or_used_tokens = tokens_query.all()
-    # delete all expired tokens periodically, on logout because we can't delete tokens on access cause of Microsoft
-    for token in expired_or_used_tokens:
-        token.delete()
-        
+    # expired and used tokens are deleted by the purge_login_tokens job
     logout(request)
     return redirect('home') 
@@ -11,15 +11,22 @@ class Cart(object):
             cart = self.session[settings.CART_SESSION_ID] = {}
 
         self.cart = cart
+        self._items = None
 
-    def __iter__(self):
-        for key in self.cart.keys():
-            self.cart[str(key)]["item"] = Item.objects.get(pk=key)
-
-        for item in self.cart.values():
-            item["total_price"] = item["item"].price * item["quantity"]
+    def items(self):
+        # every item in the cart, loaded with one query and kept until the cart changes
+        if self._items is None:
+            self._items = Item.objects.in_bulk([int(key) for key in self.cart])
+        return self._items
 
-            yield item
+    def __iter__(self):
+        items = self.items()
+        for key, line in self.cart.items():
+            item = items.get(int(key))
+            # skip items that were deleted from the store
+            if item is None:
+                continue
+            yield {**line, "item": item, "total_price": item.price * line["quantity"]}
 
     def __len__(self):
         return sum(item["quantity"] for item in self.cart.values())
@@ -27,6 +34,7 @@ class Cart(object):
     def save(self):
         self.session[settings.CART_SESSION_ID] = self.cart
         self.session.modified = True
+        self._items = None
 
     def add(self, item_id, quantity=1, update_quantity=False):
         item_id = str(item_id)
@@ -54,14 +62,18 @@ class Cart(object):
         self.save()
 
     def total(self):
-        for id in self.cart.keys():
-            self.cart[str(id)]["item"] = Item.objects.get(pk=id)
-        return sum(
-            (item["item"].price * item["quantity"]) for item in self.cart.values()
-        )
+        return sum(line["total_price"] for line in self)
 
     def get_item(self, item_id):
         if str(item_id) in self.cart:
             return self.cart[str(item_id)]
         else:
             return None
+
+
+def get_cart(request):
+    # one Cart per request, so the context processor, the view and the templates share the
+    # items it loaded
+    if not hasattr(request, "_cart"):
+        request._cart = Cart(request)
+    return request._cart
@@ -1,5 +1,5 @@
-from .cart import Cart
+from .cart import get_cart
 
 
 def cart(request):
-    return {"cart": Cart(request)}
+    return {"cart": get_cart(request)}
@@ -1,3 +1,60 @@
+from django.conf import settings
 from django.test import TestCase
+from accounts.models import CustomUser
+from engage.models import Item, Order, OutboundEmail, PointsTransaction
+from engage.points import redeem_points
+from engage.testing import make_user, plain_static_files
 
-# Create your tests here.
+
+@plain_static_files
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = make_user("a@example.com", balance=100)
+        self.mug = Item.objects.create(name="Mug", price=30, description="")
+        self.client.force_login(self.user)
+
+    def fill_cart(self, quantity):
+        session = self.client.session
+        session[settings.CART_SESSION_ID] = {str(self.mug.pk): {"quantity": quantity, "id": str(self.mug.pk)}}
+        session.save()
+
+    def test_checkout_takes_the_total_and_records_the_order(self):
+        self.fill_cart(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/checkout/")
+        self.assertTemplateUsed(response, "cart/checkout.html")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10)
+        order = Order.objects.get()
+        self.assertEqual(order.total, 90)
+        self.assertEqual(list(order.lines.values_list("name", "price", "quantity")), [("Mug", 30, 3)])
+        self.assertEqual(list(PointsTransaction.objects.values_list("kind", "amount", "order")), [
+            (PointsTransaction.REDEMPTION, -90, order.pk)
+        ])
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID], {})
+        self.assertEqual(OutboundEmail.objects.get().subject, "New Order")
+
+    def test_checkout_over_the_balance_changes_nothing(self):
+        self.fill_cart(4)
+        response = self.client.post("/checkout/")
+        self.assertTrue(response.context["insufficient_funds"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 100)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(PointsTransaction.objects.exists())
+        # the cart is kept so the user can take something out
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID][str(self.mug.pk)]["quantity"], 4)
+
+    def test_a_second_checkout_cannot_spend_the_same_balance(self):
+        # two requests that each loaded the user with the full balance
+        first, second = CustomUser.objects.get(pk=self.user.pk), CustomUser.objects.get(pk=self.user.pk)
+        self.assertTrue(redeem_points(first, 60))
+        self.assertFalse(redeem_points(second, 60))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 40)
+        self.assertEqual(PointsTransaction.objects.count(), 1)
+
+    def test_spending_the_exact_balance(self):
+        self.assertTrue(redeem_points(self.user, 100))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 0)
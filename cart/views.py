@@ -1,17 +1,20 @@
 from django.shortcuts import render, redirect
-from engage.models import Item
+from engage.models import Item, Order, OrderLine
 from accounts.models import CustomUser
 from django.http import HttpResponse
-from .cart import Cart
+from django.db import transaction
+from .cart import get_cart
 from django.template.loader import render_to_string
-from django.core.mail import send_mail
+from engage.catalog import catalog_items
+from engage.mail import queue_mail
+from engage.points import redeem_points
 import random
 
 # Create your views here.
 
 
 def add_to_cart(request, item_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     cart.add(item_id)
     response = render(request, "cart/menu_cart.html")
     response["HX-Trigger"] = "update-menu-cart"
@@ -19,7 +22,7 @@ def add_to_cart(request, item_id):
 
 
 def update_cart(request, item_id, action):
-    cart = Cart(request)
+    cart = get_cart(request)
 
     if action == "increment":
         cart.add(item_id, 1, True)
@@ -74,42 +77,56 @@ def hx_summary(request):
 def checkout(request):
     if not request.user.is_authenticated:
         return redirect("send_login_link")
-    cart = Cart(request)
-    total = cart.total()
+    cart = get_cart(request)
+    # the lines are kept before the cart is emptied, for the confirmation page
+    items = list(cart)
+    if not items:
+        response = render(request, "cart/cart.html", {"empty_cart": True})
+        return response
+    total = sum(line["total_price"] for line in items)
     user = request.user
-    if request.user.balance >= total and len(cart) > 0:
-        items = cart
-        email_order(request, user)
-        clear_cart(request)
-        user.balance -= total
-        user.save()
-        return render(request, "cart/checkout.html", {"items": items})
-    elif len(cart) > 0:
+    with transaction.atomic():
+        order = Order.objects.create(user=user, total=total)
+        # the balance is only taken if it still covers the total, so concurrent checkouts
+        # can't overspend
+        paid = redeem_points(user, total, order)
+        if not paid:
+            transaction.set_rollback(True)
+        else:
+            OrderLine.objects.bulk_create([
+                OrderLine(
+                    order=order,
+                    item=line["item"],
+                    name=line["item"].name,
+                    price=line["item"].price,
+                    quantity=line["quantity"],
+                )
+                for line in items
+            ])
+            transaction.on_commit(lambda: email_order(order))
+    if not paid:
         # fail state; not enough currency
         # render with error message
         response = render(request, "cart/cart.html", {"insufficient_funds": True})
         return response
-    else:
-        response = render(request, "cart/cart.html", {"empty_cart": True})
-        return response
+    cart.empty()
+    user.balance -= total
+    return render(request, "cart/checkout.html", {"items": items})
 
 
-def email_order(request, user):
-    cart = Cart(request)
-    admin = list(CustomUser.objects.filter(is_staff=True))
-    email = []
-    for staff in admin:
-        email.append(staff.email)
+def email_order(order):
+    email = list(CustomUser.objects.filter(is_staff=True).values_list("email", flat=True))
     subject = "New Order"
     message = render_to_string(
-        "cart/partials/order_message.html", {"user": user, "cart": cart}
+        "cart/partials/order_message.html",
+        {"user": order.user, "order": order, "lines": order.lines.all()},
     )
     from_email = "noreply@engage.bogz.dev"
-    send_mail(subject, message, from_email, email)
+    queue_mail(subject, message, from_email, email)
 
 
 def clear_cart(request):
-    cart = Cart(request)
-    items = Item.objects.all()
+    cart = get_cart(request)
+    items = catalog_items().values()
     cart.empty()
     return render(request, "store.html", {"items": items})
@@ -0,0 +1,19 @@
+from django.utils import timezone
+from .models import Activity
+
+
+# an activity is over once its end date has passed; the expire_activities job, the home
+# page sections and the past activities pages all split on this, so nothing shows up as
+# both current and past or moves between them depending on when the job last ran
+def finished(activities, now=None):
+    return activities.filter(end_date__lt=now or timezone.now())
+
+
+def ongoing(activities, now=None):
+    return activities.filter(end_date__gte=now or timezone.now())
+
+
+def past_activities(now=None):
+    # the set the home page's past section and its load-more cursor both page through,
+    # built in one place so every page walks the same rows
+    return finished(Activity.objects.filter(is_approved=True), now)
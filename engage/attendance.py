@@ -0,0 +1,89 @@
+import csv
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from accounts.models import CustomUser
+from .events import publish
+from .models import Activity, PointsTransaction, UserParticipated
+from .points import award_points
+from .scores import credit_participation, credit_participations
+
+
+def attendee_emails(lines):
+    # pull every email address out of pasted text or an uploaded CSV, whatever its columns
+    emails = []
+    for row in csv.reader(lines):
+        for cell in row:
+            for word in cell.replace(";", " ").split():
+                if "@" in word:
+                    emails.append(word.strip().lower())
+    return list(dict.fromkeys(emails))
+
+
+def claim_participation(user, activity):
+    # the insert is the check: a second claim, however close behind, hits the unique
+    # constraint and pays nothing, returns whether this claim went through
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                UserParticipated.objects.create(user=user, activity=activity)
+        except IntegrityError:
+            return False
+        # any failure from here on rolls the claim back with it and is raised as usual
+        award_points(user, activity)
+        credit_participation(user, activity)
+    transaction.on_commit(lambda: publish_scores([user.id], activity))
+    return True
+
+
+def publish_scores(user_ids, activity):
+    # name the boards the activity counts towards so only their viewers re-fetch
+    publish("leaderboard", {
+        "user_ids": user_ids,
+        "points": activity.points,
+        "leaderboard_ids": list(activity.leaderboards.values_list("id", flat=True)),
+    })
+
+
+def award_attendees(activity, emails):
+    # mark everyone on an attendance list as participated and pay them in one transaction,
+    # returns (awarded users, emails already awarded, unknown emails)
+    emails = [email.lower() for email in emails]
+    # emails are stored as typed, so match them case-insensitively
+    matches = CustomUser.objects.annotate(email_lower=Lower("email")).filter(email_lower__in=emails)
+    users = {user.email_lower: user for user in matches}
+    unknown = [email for email in emails if email not in users]
+    try:
+        awarded, already = _pay_attendees(activity, list(users.values()))
+    except IntegrityError:
+        # someone claimed while the list was being paid and nothing was written, the
+        # second pass sees their claim and skips them
+        awarded, already = _pay_attendees(activity, list(users.values()))
+    skipped = [user.email for user in users.values() if user.pk in already]
+    return awarded, skipped, unknown
+
+
+def _pay_attendees(activity, users):
+    with transaction.atomic():
+        already = set(
+            UserParticipated.objects.filter(activity=activity, user__in=users).values_list("user_id", flat=True)
+        )
+        awarded = [user for user in users if user.pk not in already]
+        user_ids = [user.pk for user in awarded]
+        if awarded:
+            UserParticipated.objects.bulk_create([UserParticipated(user=user, activity=activity) for user in awarded])
+            # attendees show up with the interested users, like anyone who claimed themselves
+            Activity.interested_users.through.objects.bulk_create(
+                [Activity.interested_users.through(activity=activity, customuser=user) for user in awarded],
+                ignore_conflicts=True,
+            )
+            PointsTransaction.objects.bulk_create([
+                PointsTransaction(user=user, kind=PointsTransaction.AWARD, amount=activity.points, activity=activity)
+                for user in awarded
+            ])
+            CustomUser.objects.filter(pk__in=user_ids).update(
+                balance=F("balance") + activity.points, lifetime_points=F("lifetime_points") + activity.points
+            )
+            credit_participations(user_ids, activity)
+            transaction.on_commit(lambda: publish_scores(user_ids, activity))
+    return awarded, already
@@ -0,0 +1,53 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import Item
+from .notifications import unread_notifications_count
+
+
+CATALOG_VERSION_KEY = "store:catalog:version"
+
+
+# the cached catalog and every store page ETag carry this version, bumping it on any item
+# change drops the cached catalog and the ETags browsers hold at once
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_catalog():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # the key was evicted, start from a fresh timestamp so old versions can't come back
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def catalog_items():
+    # every store item by id, loaded once per catalog version
+    key = f"store:catalog:{catalog_version()}"
+    items = cache.get(key)
+    if items is None:
+        items = {item.pk: item for item in Item.objects.all()}
+        cache.set(key, items, settings.STORE_CACHE_TIMEOUT)
+    return items
+
+
+def store_etag(request, pk=None):
+    # store pages show the viewer's balance, cart, unread badge and CSRF token around the
+    # catalog, so all of them go into the tag; changing any one means a fresh page
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    cart = request.session.get(settings.CART_SESSION_ID) or {}
+    state = [
+        catalog_version(),
+        pk,
+        user.pk,
+        user.is_staff,
+        user.balance,
+        unread_notifications_count(user),
+        sorted((key, line["quantity"]) for key, line in cart.items()),
+        request.META.get("CSRF_COOKIE"),
+    ]
+    return hashlib.md5(repr(state).encode()).hexdigest()
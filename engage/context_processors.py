@@ -1,3 +1,5 @@
+from .notifications import unread_notifications_count
+
 # this is just used to specify which defined URL belongs in which category
 # if a URL has a viewable view, then if it is a part of home, leaderboard, profile, store, notifications, or modtools categories--
 # then it will be placed in the appropriate category below
@@ -22,7 +24,7 @@ def current_section(request):
 
 def unread_notifications(request):
     if request.user.is_authenticated:
-        unread_count = request.user.notifications.filter(read=False).count()
+        unread_count = unread_notifications_count(request.user)
         return {
             'has_unread': unread_count > 0,
             'unread_count': unread_count,
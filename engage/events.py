@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from django.db import DatabaseError
+from django.db.models import Max
+from django.utils import timezone
+from .models import LiveEvent
+
+
+# pub/sub feeding the server-sent events stream across worker processes: views publish by
+# writing a LiveEvent row, and in every process that has streams open one task polls for new
+# rows and hands them to the asyncio queues of the browsers connected to it
+QUEUE_SIZE = 100
+POLL_INTERVAL = 1
+# rows are only needed until every worker has polled them
+RETENTION = timedelta(minutes=10)
+
+_lock = threading.Lock()
+# event loop -> user id -> set of queues for each open stream of that user
+_subscribers = {}
+# event loop -> the task polling for that loop's streams
+_pollers = {}
+
+
+def subscribe(user_id):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(loop, {}).setdefault(user_id, set()).add(queue)
+        if loop not in _pollers:
+            _pollers[loop] = loop.create_task(_poll(loop))
+    return queue
+
+
+def unsubscribe(user_id, queue):
+    with _lock:
+        for streams in _subscribers.values():
+            queues = streams.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del streams[user_id]
+
+
+def _put(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # a stalled browser misses events rather than holding memory
+        pass
+
+
+def _deliver(loop, live_event):
+    message = f"event: {live_event.event}\ndata: {json.dumps(live_event.data)}\n\n"
+    with _lock:
+        streams = _subscribers.get(loop, {})
+        if live_event.recipient_id is None:
+            queues = [queue for queues in streams.values() for queue in queues]
+        else:
+            queues = list(streams.get(live_event.recipient_id, ()))
+    for queue in queues:
+        _put(queue, message)
+
+
+async def _poll(loop):
+    last_id = None
+    while True:
+        with _lock:
+            if not _subscribers.get(loop):
+                # the last stream closed, the next subscribe starts a new poller
+                _subscribers.pop(loop, None)
+                _pollers.pop(loop, None)
+                return
+        try:
+            if last_id is None:
+                # only what's published from now on, a stream doesn't replay old events
+                last_id = (await LiveEvent.objects.aaggregate(last_id=Max("id")))["last_id"] or 0
+            else:
+                async for live_event in LiveEvent.objects.filter(id__gt=last_id).order_by("id"):
+                    last_id = live_event.id
+                    _deliver(loop, live_event)
+        except DatabaseError:
+            # a locked or unreachable database only delays events, try again next round
+            pass
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def publish(event, data, user_id=None):
+    # send to one user's streams, or to everyone's when user_id is None
+    LiveEvent.objects.create(event=event, data=data, recipient_id=user_id)
+
+
+def purge_events():
+    # drop events every worker has long since relayed, returns how many were deleted
+    return LiveEvent.objects.filter(created_at__lt=timezone.now() - RETENTION).delete()[0]
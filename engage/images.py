@@ -0,0 +1,35 @@
+from urllib.parse import urlsplit
+
+CLOUDINARY_HOST = "res.cloudinary.com"
+UPLOAD_MARKER = "/image/upload/"
+
+
+# every uploaded image is stored as its original secure_url; these insert a Cloudinary
+# transformation into it so a page downloads the size it draws, in the best format the
+# browser accepts (f_auto) at an automatic quality (q_auto). anything that isn't a
+# Cloudinary upload, e.g. a static default, is passed through untouched
+def cloudinary_url(url, width, height=None, crop="fill"):
+    if not url or urlsplit(url).netloc != CLOUDINARY_HOST or UPLOAD_MARKER not in url:
+        return url
+    head, rest = url.split(UPLOAD_MARKER, 1)
+    transformation = f"w_{width}" + (f",h_{height}" if height else "") + f",c_{crop},f_auto,q_auto"
+    return f"{head}{UPLOAD_MARKER}{transformation}/{rest}"
+
+
+def square_url(url, size):
+    # avatars and logos, cropped to fill a size x size box
+    return cloudinary_url(url, size, size)
+
+
+def square_srcset(url, size, densities=(1, 2, 3)):
+    # the same box for high density screens, as 1x/2x/3x candidates
+    if square_url(url, size) == url:
+        return ""
+    return ", ".join(f"{square_url(url, size * density)} {density}x" for density in densities)
+
+
+def width_srcset(url, widths):
+    # photos drawn at a fluid width, scaled down (never up) to each candidate width
+    if cloudinary_url(url, widths[0]) == url:
+        return ""
+    return ", ".join(f"{cloudinary_url(url, width, crop='limit')} {width}w" for width in widths)
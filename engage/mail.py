@@ -0,0 +1,123 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Avg, F, Min
+from django.utils import timezone
+from .models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_mail(subject, body, from_email, recipients):
+    # one message to all recipients, sent by the send_outbox worker
+    return OutboundEmail.objects.create(
+        subject=subject, body=body, from_email=from_email, recipients=list(recipients)
+    )
+
+
+def queue_bulk_mail(subject, body, from_email, recipients):
+    # every recipient gets their own copy, queued in ESP sized batches so a failure only
+    # retries its batch
+    recipients = list(recipients)
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(subject=subject, body=body, from_email=from_email, recipients=batch, bulk=True)
+        for batch in batched(recipients, settings.BULK_EMAIL_BATCH_SIZE)
+    ])
+
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def build_messages(email, connection):
+    if not email.bulk:
+        return [EmailMessage(email.subject, email.body, email.from_email, email.recipients, connection=connection)]
+    if settings.EMAIL_BACKEND.startswith("anymail."):
+        from anymail.message import AnymailMessage
+        # merge_data turns the message into an ESP batch send: one API call, and every
+        # recipient still gets their own copy and can't see the others
+        return [AnymailMessage(
+            email.subject, email.body, email.from_email, email.recipients,
+            connection=connection,
+            merge_data={address: {} for address in email.recipients},
+        )]
+    return [
+        EmailMessage(email.subject, email.body, email.from_email, [address], connection=connection)
+        for address in email.recipients
+    ]
+
+
+def claim_due(limit):
+    # flip due rows to sending one by one, a row another worker got first is skipped
+    due = OutboundEmail.objects.filter(
+        status=OutboundEmail.PENDING, next_attempt_at__lte=timezone.now()
+    ).order_by("next_attempt_at", "id").values_list("id", flat=True)[:limit]
+    claimed = [
+        pk for pk in due
+        if OutboundEmail.objects.filter(pk=pk, status=OutboundEmail.PENDING).update(status=OutboundEmail.SENDING)
+    ]
+    return list(OutboundEmail.objects.filter(pk__in=claimed))
+
+
+def release_stuck():
+    # rows left sending by a worker that died go back in the queue
+    return OutboundEmail.objects.filter(status=OutboundEmail.SENDING).update(status=OutboundEmail.PENDING)
+
+
+def send_claimed(emails):
+    # send a chunk of claimed rows over one connection, returns (sent, failed)
+    sent = failed = 0
+    try:
+        connection = get_connection()
+        connection.open()
+    except Exception as error:
+        # no connection to the provider, so none of them went out and all wait for a retry
+        for email in emails:
+            retry_later(email, error)
+        return 0, len(emails)
+    with connection:
+        for email in emails:
+            try:
+                connection.send_messages(build_messages(email, connection))
+            except Exception as error:
+                retry_later(email, error)
+                failed += 1
+            else:
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status=OutboundEmail.SENT, sent_at=timezone.now(), attempts=F("attempts") + 1, last_error=""
+                )
+                sent += 1
+    return sent, failed
+
+
+def retry_later(email, error):
+    attempts = email.attempts + 1
+    if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        logger.error("giving up on outbound email %s after %d attempts: %s", email.pk, attempts, error)
+        status, next_attempt_at = OutboundEmail.FAILED, email.next_attempt_at
+    else:
+        # exponential backoff: base, 2x base, 4x base...
+        status = OutboundEmail.PENDING
+        next_attempt_at = timezone.now() + timedelta(seconds=settings.OUTBOX_RETRY_BASE * 2 ** (attempts - 1))
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=str(error)[:1000]
+    )
+
+
+def outbox_metrics(window=timedelta(hours=1)):
+    now = timezone.now()
+    pending = OutboundEmail.objects.filter(status__in=[OutboundEmail.PENDING, OutboundEmail.SENDING])
+    recent = OutboundEmail.objects.filter(status=OutboundEmail.SENT, sent_at__gte=now - window)
+    oldest = pending.aggregate(oldest=Min("created_at"))["oldest"]
+    latency = recent.aggregate(latency=Avg(F("sent_at") - F("created_at")))["latency"]
+    return {
+        "queue_depth": pending.count(),
+        "oldest_pending_seconds": (now - oldest).total_seconds() if oldest else 0,
+        "sent_recently": recent.count(),
+        "avg_latency_seconds": latency.total_seconds() if latency else 0,
+        "retrying": pending.filter(attempts__gt=0).count(),
+        "failed": OutboundEmail.objects.filter(status=OutboundEmail.FAILED).count(),
+    }
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from engage.attendance import attendee_emails, award_attendees
+from engage.models import Activity
+
+
+class Command(BaseCommand):
+    help = "Mark a list of attendees as participated in an activity and award them its points"
+
+    def add_arguments(self, parser):
+        parser.add_argument("activity_id", type=int)
+        parser.add_argument("emails", nargs="*", help="attendee email addresses")
+        parser.add_argument("--csv", help="CSV file with the attendees' email addresses, in any column")
+
+    def handle(self, *args, **options):
+        try:
+            activity = Activity.objects.get(pk=options["activity_id"])
+        except Activity.DoesNotExist:
+            raise CommandError(f"Activity {options['activity_id']} does not exist")
+        lines = list(options["emails"])
+        if options["csv"]:
+            with open(options["csv"], newline="", encoding="utf-8-sig") as f:
+                lines += f.read().splitlines()
+        awarded, skipped, unknown = award_attendees(activity, attendee_emails(lines))
+        for email in skipped:
+            self.stdout.write(f"Already awarded: {email}")
+        for email in unknown:
+            self.stderr.write(f"No account for: {email}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Awarded {activity.points} points to {len(awarded)} attendees of {activity}"
+        ))
@@ -0,0 +1,27 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from engage.scores import close_month, previous_month
+
+
+class Command(BaseCommand):
+    help = "Snapshot the final user and team standings of a month (defaults to last month)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="month to close, as YYYY-MM")
+        parser.add_argument("--force", action="store_true", help="re-snapshot a month that was already closed")
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                month = datetime.strptime(options["month"], "%Y-%m").date()
+            except ValueError:
+                raise CommandError("--month must look like YYYY-MM")
+        else:
+            month = previous_month()
+        closed = close_month(month, force=options["force"])
+        if closed is None:
+            self.stdout.write(f"{month:%B %Y} is already closed")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Closed {month:%B %Y}: {closed[0]} user and {closed[1]} team standings"
+            ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from engage.activities import finished
+from engage.models import Activity
+
+
+class Command(BaseCommand):
+    help = "Mark every activity whose end date has passed as inactive"
+
+    def handle(self, *args, **options):
+        # one UPDATE for everything that ended, instead of per-row saves on page loads
+        expired = finished(Activity.objects.filter(is_active=True)).update(is_active=False)
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} activities"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from engage.mail import outbox_metrics
+
+
+class Command(BaseCommand):
+    help = "Show outbound email queue depth, send latency and failure counts"
+
+    def handle(self, *args, **options):
+        for name, value in outbox_metrics().items():
+            self.stdout.write(f"{name}: {value:g}")
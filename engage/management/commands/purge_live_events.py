@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from engage.events import purge_events
+
+
+class Command(BaseCommand):
+    help = "Delete live events every worker has already relayed to its streams"
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Removed {purge_events()} live events"))
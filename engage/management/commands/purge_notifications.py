@@ -0,0 +1,19 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from engage.notifications import purge_notifications
+
+
+class Command(BaseCommand):
+    help = "Delete old read notifications and read broadcasts and collapse duplicate notifications"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.NOTIFICATION_RETENTION_DAYS, help="retention period in days")
+        parser.add_argument("--chunk", type=int, default=1000, help="rows deleted per transaction")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        expired, collapsed = purge_notifications(options["days"], options["chunk"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {expired} expired and {collapsed} duplicate notifications in {time.monotonic() - started:.2f}s"
+        ))
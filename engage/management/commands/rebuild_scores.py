@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from engage.scores import rebuild_scores
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly UserScore rollups from UserParticipated"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="only rebuild this user id (repeatable)")
+
+    def handle(self, *args, **options):
+        rows = rebuild_scores(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} score rows"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from engage.notifications import reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = "Recount the unread notification counters from the Notification table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="only reconcile this user id (repeatable)")
+
+    def handle(self, *args, **options):
+        users = reconcile_unread_counts(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled unread counts of {users} users"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from engage.points import points_drift, reconcile_points
+
+
+class Command(BaseCommand):
+    help = "Report users whose balance or lifetime points drifted from the points ledger, --fix rewrites them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="only check this user id (repeatable)")
+        parser.add_argument("--fix", action="store_true", help="overwrite the drifted balances with the ledger totals")
+
+    def handle(self, *args, **options):
+        drifted = list(points_drift(options["user_ids"]))
+        for user in drifted:
+            self.stdout.write(
+                f"{user['email']}: balance {user['balance']} (ledger {user['ledger_balance']}), "
+                f"lifetime {user['lifetime_points']} (ledger {user['ledger_lifetime']})"
+            )
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Every balance matches the ledger"))
+        elif options["fix"]:
+            users = reconcile_points([user["id"] for user in drifted])
+            self.stdout.write(self.style.SUCCESS(f"Reconciled the points of {users} users"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} users drifted from the ledger, rerun with --fix to rewrite them"))
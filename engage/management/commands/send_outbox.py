@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from engage.mail import batched, claim_due, outbox_metrics, release_stuck, send_claimed
+
+
+def send_and_close(emails):
+    try:
+        return send_claimed(emails)
+    finally:
+        # each pool thread has its own database connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Send queued outbound emails, retrying failures with exponential backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="emails sent in parallel, each over its own connection")
+        parser.add_argument("--chunk", type=int, default=20, help="emails each connection sends per round")
+        parser.add_argument("--interval", type=float, default=1.0, help="seconds between polls when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="exit once nothing is due instead of polling")
+
+    def handle(self, *args, **options):
+        concurrency = max(options["concurrency"], 1)
+        chunk = max(options["chunk"], 1)
+        # only one worker runs, so anything still marked sending was interrupted mid-send
+        release_stuck()
+        with ThreadPoolExecutor(concurrency) as pool:
+            while True:
+                emails = claim_due(concurrency * chunk)
+                if not emails:
+                    if options["once"]:
+                        return
+                    time.sleep(options["interval"])
+                    continue
+                started = time.monotonic()
+                chunks = list(batched(emails, max(len(emails) // concurrency, 1)))
+                results = list(pool.map(send_and_close, chunks))
+                elapsed = time.monotonic() - started
+                sent = sum(result[0] for result in results)
+                failed = sum(result[1] for result in results)
+                self.stdout.write(
+                    f"sent {sent}, failed {failed} in {elapsed:.2f}s "
+                    f"({sent / elapsed if elapsed else 0:.1f}/s), {outbox_metrics()['queue_depth']} queued"
+                )
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def backfill_scores(apps, schema_editor):
+    UserParticipated = apps.get_model('engage', 'UserParticipated')
+    UserScore = apps.get_model('engage', 'UserScore')
+    participations = UserParticipated.objects.annotate(
+        month=TruncMonth('date_participated', output_field=models.DateField())
+    )
+    totals = participations.values('user_id', 'month').annotate(points=models.Sum('activity__points'))
+    per_leaderboard = (
+        participations.filter(activity__leaderboards__isnull=False)
+        .values('user_id', 'activity__leaderboards', 'month')
+        .annotate(points=models.Sum('activity__points'))
+    )
+    UserScore.objects.bulk_create(
+        [UserScore(user_id=row['user_id'], month=row['month'], points=row['points']) for row in totals]
+        + [
+            UserScore(
+                user_id=row['user_id'],
+                leaderboard_id=row['activity__leaderboards'],
+                month=row['month'],
+                points=row['points'],
+            )
+            for row in per_leaderboard
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engage', '0007_team_created_on'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('leaderboard', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='engage.leaderboard')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'leaderboard'], name='engage_user_month_d08c48_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='userscore',
+            constraint=models.UniqueConstraint(fields=('user', 'leaderboard', 'month'), name='unique_user_leaderboard_month'),
+        ),
+        migrations.AddConstraint(
+            model_name='userscore',
+            constraint=models.UniqueConstraint(condition=models.Q(('leaderboard__isnull', True)), fields=('user', 'month'), name='unique_user_month_total'),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:03
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_team_points(apps, schema_editor):
+    Team = apps.get_model('engage', 'Team')
+    month = timezone.localdate().replace(day=1)
+    teams = Team.objects.annotate(
+        points=models.Sum(
+            'member__scores__points',
+            filter=models.Q(member__scores__month=month, member__scores__leaderboard__isnull=True),
+        )
+    )
+    teams = sorted(teams, key=lambda team: (-(team.points or 0), team.id))
+    for rank, team in enumerate(teams, start=1):
+        team.monthly_points = team.points or 0
+        team.points_month = month
+        team.monthly_rank = rank
+    Team.objects.bulk_update(teams, ['monthly_points', 'points_month', 'monthly_rank'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engage', '0008_userscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='monthly_points',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='points_month',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_team_points, migrations.RunPython.noop),
+    ]
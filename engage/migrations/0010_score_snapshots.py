@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engage', '0009_team_monthly_points'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamScoreSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('points', models.IntegerField()),
+                ('rank', models.IntegerField()),
+                ('leaderboard', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='engage.leaderboard')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_snapshots', to='engage.team')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'leaderboard', 'rank'], name='engage_team_month_13b2d2_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserScoreSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('points', models.IntegerField()),
+                ('rank', models.IntegerField()),
+                ('leaderboard', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='engage.leaderboard')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'leaderboard', 'rank'], name='engage_user_month_a1009b_idx')],
+            },
+        ),
+    ]
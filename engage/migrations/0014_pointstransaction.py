@@ -0,0 +1,56 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # one award per existing participation, at the activity's current points, then opening
+    # and redemption entries so every user's ledger sums to their balance and lifetime points
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    UserParticipated = apps.get_model('engage', 'UserParticipated')
+    PointsTransaction = apps.get_model('engage', 'PointsTransaction')
+    entries = []
+    awarded = {}
+    for participation in UserParticipated.objects.select_related('activity').iterator():
+        points = participation.activity.points
+        entries.append(PointsTransaction(
+            user_id=participation.user_id, kind='award', amount=points, activity_id=participation.activity_id
+        ))
+        awarded[participation.user_id] = awarded.get(participation.user_id, 0) + points
+    for user in CustomUser.objects.only('id', 'balance', 'lifetime_points').iterator():
+        opening = user.lifetime_points - awarded.get(user.id, 0)
+        if opening:
+            entries.append(PointsTransaction(user_id=user.id, kind='opening', amount=opening))
+        redeemed = user.balance - user.lifetime_points
+        if redeemed:
+            entries.append(PointsTransaction(user_id=user.id, kind='redemption', amount=redeemed))
+    PointsTransaction.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engage', '0013_order'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('award', 'Award'), ('reversal', 'Reversal'), ('redemption', 'Redemption'), ('opening', 'Opening balance')], max_length=10)),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='engage.activity')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='engage.order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='engage_poin_user_id_369e06_idx'), models.Index(fields=['activity', 'user'], name='engage_poin_activit_b17e60_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
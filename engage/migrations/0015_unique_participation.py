@@ -0,0 +1,106 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DateField, F, Min, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def drop_duplicate_participations(apps, schema_editor):
+    # double claims left more than one row per user and activity, keep the first of each
+    UserParticipated = apps.get_model('engage', 'UserParticipated')
+    duplicates = (
+        UserParticipated.objects.values('user_id', 'activity_id')
+        .annotate(first_id=Min('id'), rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        UserParticipated.objects.filter(user_id=row['user_id'], activity_id=row['activity_id']).exclude(
+            id=row['first_id']
+        ).delete()
+
+
+def repair_rollups(apps, schema_editor):
+    # the duplicates were paid and scored too: reverse whatever the ledger holds beyond one
+    # award per remaining participation, then rebuild those users' score rows and their
+    # teams' month-to-date points and ranks, the way engage.scores does
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Activity = apps.get_model('engage', 'Activity')
+    PointsTransaction = apps.get_model('engage', 'PointsTransaction')
+    Team = apps.get_model('engage', 'Team')
+    UserParticipated = apps.get_model('engage', 'UserParticipated')
+    UserScore = apps.get_model('engage', 'UserScore')
+    participated = set(UserParticipated.objects.values_list('user_id', 'activity_id'))
+    points = dict(Activity.objects.values_list('id', 'points'))
+    paid = (
+        PointsTransaction.objects.filter(activity__isnull=False)
+        .values('user_id', 'activity_id')
+        .annotate(net=Sum('amount'))
+    )
+    reversals = []
+    taken = {}
+    for row in paid:
+        if (row['user_id'], row['activity_id']) not in participated:
+            continue
+        excess = row['net'] - points[row['activity_id']]
+        if excess > 0:
+            reversals.append(PointsTransaction(
+                user_id=row['user_id'], kind='reversal', amount=-excess, activity_id=row['activity_id']
+            ))
+            taken[row['user_id']] = taken.get(row['user_id'], 0) + excess
+    if not taken:
+        return
+    PointsTransaction.objects.bulk_create(reversals, batch_size=500)
+    for user_id, amount in taken.items():
+        CustomUser.objects.filter(pk=user_id).update(
+            balance=F('balance') - amount, lifetime_points=F('lifetime_points') - amount
+        )
+
+    user_ids = list(taken)
+    participations = UserParticipated.objects.filter(user_id__in=user_ids).annotate(
+        month=TruncMonth('date_participated', output_field=DateField())
+    )
+    rows = [
+        UserScore(user_id=row['user_id'], month=row['month'], points=row['points'])
+        for row in participations.values('user_id', 'month').annotate(points=Sum('activity__points'))
+    ] + [
+        UserScore(
+            user_id=row['user_id'], leaderboard_id=row['activity__leaderboards'], month=row['month'], points=row['points']
+        )
+        for row in participations.filter(activity__leaderboards__isnull=False)
+        .values('user_id', 'activity__leaderboards', 'month')
+        .annotate(points=Sum('activity__points'))
+    ]
+    UserScore.objects.filter(user_id__in=user_ids).delete()
+    UserScore.objects.bulk_create(rows, batch_size=500)
+
+    month = timezone.localtime().date().replace(day=1)
+    Team.objects.exclude(points_month=month).update(monthly_points=0, points_month=month)
+    team_ids = list(Team.objects.filter(member__in=user_ids).values_list('id', flat=True).distinct())
+    teams = Team.objects.filter(pk__in=team_ids).annotate(
+        points=Sum('member__scores__points', filter=Q(member__scores__month=month, member__scores__leaderboard__isnull=True))
+    )
+    for team in teams:
+        Team.objects.filter(pk=team.pk).update(monthly_points=team.points or 0)
+    for rank, team_id in enumerate(
+        Team.objects.order_by('-monthly_points', 'id').values_list('id', flat=True), start=1
+    ):
+        Team.objects.filter(pk=team_id).update(monthly_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engage', '0014_pointstransaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_participations, migrations.RunPython.noop),
+        migrations.RunPython(repair_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userparticipated',
+            constraint=models.UniqueConstraint(fields=('user', 'activity'), name='unique_user_activity_participation'),
+        ),
+    ]
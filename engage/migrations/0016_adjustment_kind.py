@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engage', '0015_unique_participation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointstransaction',
+            name='kind',
+            field=models.CharField(choices=[('award', 'Award'), ('reversal', 'Reversal'), ('redemption', 'Redemption'), ('opening', 'Opening balance'), ('adjustment', 'Adjustment')], max_length=10),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
     
 # model for activities
 class Activity(models.Model):
@@ -45,15 +46,33 @@ class Activity(models.Model):
         return self.title
 
 class Notification(models.Model):
-    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    # no recipient means a broadcast to everyone, stored once; its read state is the user's
+    # notifications_seen_at cursor and dismissals are tracked in NotificationDismissal
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
     title = models.CharField(max_length=255)
     message = models.TextField()
     read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["recipient", "created_at"])]
+
     def __str__(self):
+        if self.recipient_id is None:
+            return f"Notification for everyone: {self.title}"
         return f"Notification for {self.recipient.email}: {self.title}"
 
+
+# a user hiding a broadcast notification, only broadcasts someone dismissed get rows here
+class NotificationDismissal(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    notification = models.ForeignKey("Notification", on_delete=models.CASCADE, related_name="dismissals")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "notification"], name="unique_user_notification_dismissal"),
+        ]
+
 class Leaderboard(models.Model):
     leaderboard_name = models.CharField(
         max_length=200, null=False, blank=False, unique=True
@@ -68,11 +87,71 @@ class UserParticipated(models.Model):
     user = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE)  # Renamed for clarity
     activity = models.ForeignKey("Activity", on_delete=models.CASCADE)  # Renamed for clarity
     date_participated = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # a claim is the insert of this row, so the database turns away a second one
+        constraints = [
+            models.UniqueConstraint(fields=["user", "activity"], name="unique_user_activity_participation"),
+        ]
+
     def __str__(self):
         date_str = self.date_participated.strftime("%B %d, %I:%M%p")  # Example: "March 04, 2024"
         return f"{self.user.first_name} {self.user.last_name} participated in {self.activity.title} on {date_str}"
 
 
+# points a user earned in a calendar month, rolled up per leaderboard (leaderboard=None holds
+# the all activities total), kept in sync with UserParticipated by engage.scores
+class UserScore(models.Model):
+    user = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE, related_name="scores")
+    leaderboard = models.ForeignKey("Leaderboard", on_delete=models.CASCADE, null=True, blank=True)
+    # first day of the month the points were earned in
+    month = models.DateField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "leaderboard", "month"], name="unique_user_leaderboard_month"),
+            # NULLs never collide in a unique index, so the all activities rows need their own
+            models.UniqueConstraint(
+                fields=["user", "month"], condition=models.Q(leaderboard__isnull=True), name="unique_user_month_total"
+            ),
+        ]
+        indexes = [models.Index(fields=["month", "leaderboard"])]
+
+    def __str__(self):
+        return f"{self.user} earned {self.points} points in {self.month:%B %Y}"
+
+
+# frozen standings of a closed month, written once by the close_month command so past
+# leaderboards and rank history never go back to the live tables
+class UserScoreSnapshot(models.Model):
+    user = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE, related_name="score_snapshots")
+    leaderboard = models.ForeignKey("Leaderboard", on_delete=models.CASCADE, null=True, blank=True)
+    month = models.DateField()
+    points = models.IntegerField()
+    rank = models.IntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["month", "leaderboard", "rank"])]
+
+    def __str__(self):
+        return f"{self.user} ranked #{self.rank} in {self.month:%B %Y}"
+
+
+class TeamScoreSnapshot(models.Model):
+    team = models.ForeignKey("Team", on_delete=models.CASCADE, related_name="score_snapshots")
+    leaderboard = models.ForeignKey("Leaderboard", on_delete=models.CASCADE, null=True, blank=True)
+    month = models.DateField()
+    points = models.IntegerField()
+    rank = models.IntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["month", "leaderboard", "rank"])]
+
+    def __str__(self):
+        return f"{self.team} ranked #{self.rank} in {self.month:%B %Y}"
+
+
 
 class Team(models.Model):
     name = models.CharField(max_length=200)
@@ -86,6 +165,10 @@ class Team(models.Model):
     member = models.ManyToManyField("accounts.CustomUser", related_name="team_member")
     logo = models.CharField(max_length=200, default="", blank=True)
     monthly_rank = models.IntegerField(default=0)
+    # month-to-date points of all members, maintained by engage.scores so ranking a claim
+    # doesn't have to re-aggregate every team
+    monthly_points = models.IntegerField(default=0)
+    points_month = models.DateField(null=True, blank=True)
     description = models.TextField(default="", blank=True)
     created_on = models.DateField(auto_now_add=True, null=True)
     # team points will be calculated by summing the points of all users in the team,
@@ -93,6 +176,47 @@ class Team(models.Model):
     def __str__(self):
         return self.name
 
+# server-sent events on their way to the browsers: each worker polls this table and relays
+# new rows to the streams connected to it, so a publish reaches every process
+class LiveEvent(models.Model):
+    event = models.CharField(max_length=50)
+    data = models.JSONField()
+    # only this user's streams get it, everyone's when empty
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.event} for {self.recipient or 'everyone'}"
+
+# emails waiting to be sent, drained by the send_outbox worker so no request waits on the
+# email provider and a failed send is retried instead of lost
+class OutboundEmail(models.Model):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (SENDING, "Sending"), (SENT, "Sent"), (FAILED, "Failed")]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    # send every recipient their own copy instead of one message to all of them
+    bulk = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(default="", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.subject} to {len(self.recipients)} recipients ({self.status})"
+
+
 # stores all basic item info
 class Item(models.Model):
     name = models.CharField(max_length=200)
@@ -104,6 +228,60 @@ class Item(models.Model):
         return self.name
 
 
+# append-only record of every change to a user's points; CustomUser.balance and
+# lifetime_points are rollups of it, maintained by engage.points
+class PointsTransaction(models.Model):
+    AWARD = "award"
+    REVERSAL = "reversal"
+    REDEMPTION = "redemption"
+    # balances carried over from before the ledger existed
+    OPENING = "opening"
+    # balance changes made by hand in the admin
+    ADJUSTMENT = "adjustment"
+    KIND_CHOICES = [
+        (AWARD, "Award"), (REVERSAL, "Reversal"), (REDEMPTION, "Redemption"),
+        (OPENING, "Opening balance"), (ADJUSTMENT, "Adjustment"),
+    ]
+    # points earned count towards lifetime points, redemptions and adjustments only move the balance
+    LIFETIME_KINDS = [AWARD, REVERSAL, OPENING]
+
+    user = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE, related_name="points_transactions")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # signed, negative for reversals and redemptions
+    amount = models.IntegerField()
+    activity = models.ForeignKey("Activity", on_delete=models.SET_NULL, null=True, blank=True)
+    order = models.ForeignKey("Order", on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "created_at"]), models.Index(fields=["activity", "user"])]
+
+    def __str__(self):
+        return f"{self.kind} of {self.amount} points for {self.user}"
+
+
+# a redeemed cart, written by checkout in the same transaction that takes the points
+class Order(models.Model):
+    user = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE, related_name="orders")
+    total = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Order #{self.pk} by {self.user} for {self.total} points"
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey("Order", on_delete=models.CASCADE, related_name="lines")
+    # name and price are copied so the order still reads right if the item changes or is deleted
+    item = models.ForeignKey("Item", on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.CharField(max_length=200)
+    price = models.IntegerField()
+    quantity = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.name} (x{self.quantity})"
+
+
 # stores all item color values
 class ItemColors(models.Model):
     color = models.CharField(max_length=200)
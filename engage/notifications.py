@@ -0,0 +1,187 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from accounts.models import CustomUser
+from .events import publish
+from .models import Notification, NotificationDismissal
+
+
+BROADCASTS_KEY = "notifications:broadcasts"
+# the badge only needs to count this many recent broadcasts
+BROADCASTS_CACHED = 100
+
+
+def notify(user, title, message):
+    with transaction.atomic():
+        notification = Notification.objects.create(recipient=user, title=title, message=message)
+        CustomUser.objects.filter(pk=user.pk).update(unread_notifications=F("unread_notifications") + 1)
+    transaction.on_commit(lambda: publish("notification", {"title": title}, user.pk))
+    return notification
+
+
+def notify_everyone(title, message):
+    # a single broadcast row, however many users there are
+    notification = Notification.objects.create(recipient=None, title=title, message=message)
+    transaction.on_commit(lambda: cache.delete(BROADCASTS_KEY))
+    transaction.on_commit(lambda: publish("notification", {"title": title}))
+    return notification
+
+
+def recent_broadcast_times():
+    # creation times of the newest broadcasts, shared by every user's unread badge
+    return cache.get_or_set(
+        BROADCASTS_KEY,
+        lambda: list(
+            Notification.objects.filter(recipient__isnull=True)
+            .order_by("-created_at")
+            .values_list("created_at", flat=True)[:BROADCASTS_CACHED]
+        ),
+        None,
+    )
+
+
+def visible_notifications(user):
+    # the user's own notifications plus the broadcasts sent since they joined that they
+    # haven't dismissed
+    return Notification.objects.filter(
+        Q(recipient=user) | Q(recipient__isnull=True, created_at__gte=user.date_joined)
+    ).exclude(dismissals__user=user)
+
+
+def unread_notifications_count(user):
+    # broadcasts can only be dismissed from the notifications page, which moves the read
+    # cursor past them, so the unread ones are simply those newer than the cursor
+    seen_at = max(user.notifications_seen_at or user.date_joined, user.date_joined)
+    unread_broadcasts = 0
+    for created_at in recent_broadcast_times():
+        if created_at <= seen_at:
+            break
+        unread_broadcasts += 1
+    return user.unread_notifications + unread_broadcasts
+
+
+def notifications_page(user, before_date=None, before_id=None):
+    # keyset pagination over the merged notifications, newest first, continuing strictly
+    # after the (created_at, id) of the last one delivered
+    notifications = visible_notifications(user)
+    if before_date is not None and before_id is not None:
+        notifications = notifications.filter(
+            Q(created_at__lt=before_date) | Q(created_at=before_date, id__lt=before_id)
+        )
+    page_size = settings.NOTIFICATIONS_PAGE_SIZE
+    # one extra row tells whether there is an older page
+    page = list(notifications.order_by("-created_at", "-id")[:page_size + 1])
+    return page[:page_size], len(page) > page_size
+
+
+def mark_delivered_read(user, notifications):
+    # only what was actually rendered is marked read: the delivered personal rows, and the
+    # broadcast cursor moves up to the newest delivered broadcast
+    unread_ids = [n.id for n in notifications if n.recipient_id is not None and not n.read]
+    broadcast_times = [n.created_at for n in notifications if n.recipient_id is None]
+    seen_at = user.notifications_seen_at
+    if broadcast_times and (seen_at is None or max(broadcast_times) > seen_at):
+        seen_at = max(broadcast_times)
+    if not unread_ids and seen_at == user.notifications_seen_at:
+        return
+    with transaction.atomic():
+        read = Notification.objects.filter(pk__in=unread_ids, read=False).update(read=True)
+        CustomUser.objects.filter(pk=user.pk).update(
+            notifications_seen_at=seen_at,
+            unread_notifications=Greatest(F("unread_notifications") - read, 0),
+        )
+    user.notifications_seen_at = seen_at
+    user.unread_notifications = max(user.unread_notifications - read, 0)
+    # keeps the badge right in the user's other tabs
+    transaction.on_commit(
+        lambda: publish("unread", {"count": unread_notifications_count(user)}, user.pk)
+    )
+
+
+def dismiss(user, notification):
+    if notification.recipient_id is None:
+        NotificationDismissal.objects.get_or_create(user=user, notification=notification)
+        return
+    with transaction.atomic():
+        notification.delete()
+        if not notification.read:
+            CustomUser.objects.filter(pk=user.pk, unread_notifications__gt=0).update(
+                unread_notifications=F("unread_notifications") - 1
+            )
+
+
+def reconcile_unread_counts(user_ids=None):
+    # recount every user's unread personal notifications in one UPDATE, for drift from
+    # rows changed outside these helpers (e.g. the admin)
+    unread = (
+        Notification.objects.filter(recipient=OuterRef("pk"), read=False)
+        .values("recipient")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    users = CustomUser.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    cache.delete(BROADCASTS_KEY)
+    return users.update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+
+def delete_in_chunks(notifications, chunk_size):
+    # delete a queryset a chunk at a time so no single transaction holds the write lock long
+    deleted = 0
+    while True:
+        ids = list(notifications.values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += Notification.objects.filter(id__in=ids).delete()[1].get("engage.Notification", 0)
+
+
+def read_by_everyone():
+    # a broadcast is read once every active user who joined before it has moved their read
+    # cursor past it or dismissed it
+    unread_by = CustomUser.objects.filter(
+        Q(notifications_seen_at__isnull=True) | Q(notifications_seen_at__lt=OuterRef("created_at")),
+        is_active=True,
+        date_joined__lte=OuterRef("created_at"),
+    ).exclude(
+        Exists(NotificationDismissal.objects.filter(user=OuterRef("pk"), notification=OuterRef(OuterRef("pk"))))
+    )
+    return ~Exists(unread_by)
+
+
+def purge_notifications(days, chunk_size):
+    # drop read personal notifications and read broadcasts older than the retention period,
+    # and collapse repeated copies of the same notification to a user down to the newest one
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = delete_in_chunks(
+        Notification.objects.filter(
+            Q(recipient__isnull=False, read=True) | Q(read_by_everyone(), recipient__isnull=True),
+            created_at__lt=cutoff,
+        ),
+        chunk_size,
+    )
+    duplicates = (
+        Notification.objects.filter(recipient__isnull=False)
+        .values("recipient", "title", "message")
+        .annotate(copies=Count("id"), newest=Max("id"))
+        .filter(copies__gt=1)
+    )
+    collapsed = 0
+    affected = set()
+    for group in duplicates.iterator():
+        collapsed += delete_in_chunks(
+            Notification.objects.filter(
+                recipient=group["recipient"], title=group["title"], message=group["message"], id__lt=group["newest"]
+            ),
+            chunk_size,
+        )
+        affected.add(group["recipient"])
+    # collapsed copies may have been unread, and expired broadcasts drop out of the badge
+    if affected:
+        reconcile_unread_counts(affected)
+    cache.delete(BROADCASTS_KEY)
+    return expired, collapsed
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from accounts.models import CustomUser
+from .models import PointsTransaction, UserParticipated
+
+
+def award_points(user, activity):
+    with transaction.atomic():
+        PointsTransaction.objects.create(
+            user=user, kind=PointsTransaction.AWARD, amount=activity.points, activity=activity
+        )
+        CustomUser.objects.filter(pk=user.pk).update(
+            balance=F("balance") + activity.points, lifetime_points=F("lifetime_points") + activity.points
+        )
+    user.balance += activity.points
+    user.lifetime_points += activity.points
+
+
+def reverse_participation(activity):
+    # take back exactly what every participant was awarded for the activity, whatever its
+    # points are now, and drop their participations
+    with transaction.atomic():
+        awarded = (
+            PointsTransaction.objects.filter(activity=activity)
+            .values("user_id")
+            .annotate(net=Sum("amount"))
+            .filter(net__gt=0)
+        )
+        reversals = [
+            PointsTransaction(user_id=row["user_id"], kind=PointsTransaction.REVERSAL, amount=-row["net"], activity=activity)
+            for row in awarded
+        ]
+        # participants with the same award share one UPDATE, normally that's all of them
+        by_amount = {}
+        for reversal in reversals:
+            by_amount.setdefault(-reversal.amount, []).append(reversal.user_id)
+        for amount, user_ids in by_amount.items():
+            CustomUser.objects.filter(pk__in=user_ids).update(
+                balance=F("balance") - amount, lifetime_points=F("lifetime_points") - amount
+            )
+        PointsTransaction.objects.bulk_create(reversals)
+        UserParticipated.objects.filter(activity=activity).delete()
+    return len(reversals)
+
+
+def redeem_points(user, total, order=None):
+    # take the points only if the balance still covers them, returns whether it did
+    with transaction.atomic():
+        paid = CustomUser.objects.filter(pk=user.pk, balance__gte=total).update(balance=F("balance") - total)
+        if paid:
+            PointsTransaction.objects.create(
+                user=user, kind=PointsTransaction.REDEMPTION, amount=-total, order=order
+            )
+    return bool(paid)
+
+
+def adjust_points(user, amount):
+    # a hand-made balance change, recorded so the ledger keeps summing to the balance
+    with transaction.atomic():
+        PointsTransaction.objects.create(user=user, kind=PointsTransaction.ADJUSTMENT, amount=amount)
+        CustomUser.objects.filter(pk=user.pk).update(balance=F("balance") + amount)
+
+
+def ledger_totals():
+    ledger = PointsTransaction.objects.filter(user=OuterRef("pk")).values("user")
+    return {
+        "ledger_balance": Coalesce(Subquery(ledger.annotate(total=Sum("amount")).values("total")), 0),
+        "ledger_lifetime": Coalesce(Subquery(
+            ledger.annotate(total=Sum("amount", filter=Q(kind__in=PointsTransaction.LIFETIME_KINDS))).values("total")
+        ), 0),
+    }
+
+
+def points_drift(user_ids=None):
+    # users whose balance or lifetime points no longer match their ledger, with both sides
+    users = CustomUser.objects.annotate(**ledger_totals())
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    return users.exclude(balance=F("ledger_balance"), lifetime_points=F("ledger_lifetime")).values(
+        "id", "email", "balance", "ledger_balance", "lifetime_points", "ledger_lifetime"
+    )
+
+
+def reconcile_points(user_ids=None):
+    # roll the ledger up into balance and lifetime_points again, in one UPDATE; this
+    # overwrites whatever the rollups hold, so it's only run by hand after checking the drift
+    totals = ledger_totals()
+    users = CustomUser.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    return users.update(balance=totals["ledger_balance"], lifetime_points=totals["ledger_lifetime"])
@@ -0,0 +1,189 @@
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DateField, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import Team, TeamScoreSnapshot, UserScore, UserScoreSnapshot, UserParticipated
+
+
+LEADERBOARD_VERSION_KEY = "leaderboard:version"
+
+
+# cached rankings are keyed by this version, so bumping it drops every one of them at once
+def leaderboard_version():
+    return cache.get_or_set(LEADERBOARD_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_leaderboards():
+    try:
+        cache.incr(LEADERBOARD_VERSION_KEY)
+    except ValueError:
+        # the key was evicted, start from a fresh timestamp so old versions can't come back
+        cache.set(LEADERBOARD_VERSION_KEY, time.time_ns(), None)
+
+
+# scores are bucketed by local calendar month, the same periods the leaderboard filters on
+def month_start(when=None):
+    return timezone.localtime(when).date().replace(day=1)
+
+
+def previous_month(month=None):
+    return ((month or month_start()) - timedelta(days=1)).replace(day=1)
+
+
+def credit_participation(user, activity, when=None):
+    # add the activity's points to the user's all activities row and to the row of every
+    # leaderboard the activity counts towards, creating missing rows first
+    month = month_start(when)
+    leaderboard_ids = list(activity.leaderboards.values_list("id", flat=True))
+    with transaction.atomic():
+        UserScore.objects.bulk_create(
+            [UserScore(user=user, leaderboard_id=leaderboard_id, month=month) for leaderboard_id in [None] + leaderboard_ids],
+            ignore_conflicts=True,
+        )
+        UserScore.objects.filter(
+            Q(leaderboard__isnull=True) | Q(leaderboard_id__in=leaderboard_ids), user=user, month=month
+        ).update(points=F("points") + activity.points)
+        if month == month_start():
+            roll_team_month(month)
+            Team.objects.filter(member=user).update(monthly_points=F("monthly_points") + activity.points)
+    transaction.on_commit(invalidate_leaderboards)
+
+
+def credit_participations(user_ids, activity, when=None):
+    # credit_participation for many users at once: one insert of missing rows, one UPDATE
+    # of all their rows, and their teams re-ranked a single time at the end
+    month = month_start(when)
+    user_ids = list(user_ids)
+    leaderboard_ids = list(activity.leaderboards.values_list("id", flat=True))
+    with transaction.atomic():
+        UserScore.objects.bulk_create(
+            [
+                UserScore(user_id=user_id, leaderboard_id=leaderboard_id, month=month)
+                for user_id in user_ids
+                for leaderboard_id in [None] + leaderboard_ids
+            ],
+            ignore_conflicts=True,
+        )
+        UserScore.objects.filter(
+            Q(leaderboard__isnull=True) | Q(leaderboard_id__in=leaderboard_ids), user_id__in=user_ids, month=month
+        ).update(points=F("points") + activity.points)
+        if month == month_start():
+            refresh_team_points(Team.objects.filter(member__in=user_ids).values_list("id", flat=True).distinct())
+    transaction.on_commit(invalidate_leaderboards)
+
+
+def rebuild_scores(user_ids=None):
+    # recompute the score rows of the given users (or everyone) from their participations,
+    # used whenever participations are removed or an activity's points/leaderboards change
+    participations = UserParticipated.objects.annotate(
+        month=TruncMonth("date_participated", output_field=DateField())
+    )
+    scores = UserScore.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        participations = participations.filter(user_id__in=user_ids)
+        scores = scores.filter(user_id__in=user_ids)
+    totals = participations.values("user_id", "month").annotate(points=Sum("activity__points"))
+    per_leaderboard = (
+        participations.filter(activity__leaderboards__isnull=False)
+        .values("user_id", "activity__leaderboards", "month")
+        .annotate(points=Sum("activity__points"))
+    )
+    with transaction.atomic():
+        rows = [
+            UserScore(user_id=row["user_id"], month=row["month"], points=row["points"])
+            for row in totals
+        ] + [
+            UserScore(
+                user_id=row["user_id"],
+                leaderboard_id=row["activity__leaderboards"],
+                month=row["month"],
+                points=row["points"],
+            )
+            for row in per_leaderboard
+        ]
+        scores.delete()
+        UserScore.objects.bulk_create(rows)
+    teams = Team.objects.all() if user_ids is None else Team.objects.filter(member__in=user_ids)
+    refresh_team_points(teams.values_list("id", flat=True))
+    return len(rows)
+
+
+# the first ranking of a new month zeroes every team still holding last month's points
+def roll_team_month(month):
+    Team.objects.exclude(points_month=month).update(monthly_points=0, points_month=month)
+
+
+def refresh_team_points(team_ids):
+    # recompute the month-to-date points of the given teams from their members' score rows,
+    # needed when members join or leave or when participations are rebuilt
+    month = month_start()
+    teams = Team.objects.filter(pk__in=list(team_ids)).annotate(
+        points=Sum(
+            "member__scores__points",
+            filter=Q(member__scores__month=month, member__scores__leaderboard__isnull=True),
+        )
+    )
+    with transaction.atomic():
+        roll_team_month(month)
+        changed = []
+        for team in teams:
+            team.monthly_points = team.points or 0
+            team.points_month = month
+            changed.append(team)
+        Team.objects.bulk_update(changed, ["monthly_points", "points_month"])
+        update_team_rankings()
+    transaction.on_commit(invalidate_leaderboards)
+
+
+def update_team_rankings():
+    # rank teams by their maintained points and write back only the ranks that moved
+    with transaction.atomic():
+        roll_team_month(month_start())
+        teams = Team.objects.only("id", "monthly_points", "monthly_rank").order_by("-monthly_points", "id")
+        changed = []
+        for rank, team in enumerate(teams, start=1):
+            if team.monthly_rank != rank:
+                team.monthly_rank = rank
+                changed.append(team)
+        Team.objects.bulk_update(changed, ["monthly_rank"])
+
+
+def close_month(month, force=False):
+    # freeze every user's and team's points and rank for a finished month, on every
+    # leaderboard; months that were already closed are left alone unless forced
+    if not force and UserScoreSnapshot.objects.filter(month=month).exists():
+        return None
+    ranks = {}
+    user_rows = []
+    for score in UserScore.objects.filter(month=month).order_by("-points", "user_id"):
+        ranks[score.leaderboard_id] = rank = ranks.get(score.leaderboard_id, 0) + 1
+        user_rows.append(UserScoreSnapshot(
+            user_id=score.user_id, leaderboard_id=score.leaderboard_id, month=month, points=score.points, rank=rank
+        ))
+    # teams are credited with their current members' points, like the live leaderboard
+    team_scores = (
+        UserScore.objects.filter(month=month, user__team_member__isnull=False)
+        .values("user__team_member", "leaderboard_id")
+        .annotate(total_points=Sum("points"))
+        .filter(total_points__gt=0)
+        .order_by("-total_points", "user__team_member")
+    )
+    ranks = {}
+    team_rows = []
+    for score in team_scores:
+        ranks[score["leaderboard_id"]] = rank = ranks.get(score["leaderboard_id"], 0) + 1
+        team_rows.append(TeamScoreSnapshot(
+            team_id=score["user__team_member"], leaderboard_id=score["leaderboard_id"],
+            month=month, points=score["total_points"], rank=rank,
+        ))
+    with transaction.atomic():
+        UserScoreSnapshot.objects.filter(month=month).delete()
+        TeamScoreSnapshot.objects.filter(month=month).delete()
+        UserScoreSnapshot.objects.bulk_create(user_rows)
+        TeamScoreSnapshot.objects.bulk_create(team_rows)
+    transaction.on_commit(invalidate_leaderboards)
+    return len(user_rows), len(team_rows)
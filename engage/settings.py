@@ -45,6 +45,23 @@ CSRF_TRUSTED_ORIGINS = ["https://engage.bogz.dev"]
 
 SESSION_COOKIE_AGE = 864000
 CART_SESSION_ID = "cart"
+# cached rankings are invalidated whenever scores change, the timeout only bounds staleness
+# from edits to names and pictures that bypass the views; scores can't be edited in the admin
+LEADERBOARD_CACHE_TIMEOUT = 600
+# individual leaderboards render the top N plus a window of users around the viewer,
+# the rest is loaded a page at a time
+LEADERBOARD_TOP_N = 25
+LEADERBOARD_WINDOW = 2
+LEADERBOARD_PAGE_SIZE = 25
+# past activities on the home page are loaded this many at a time
+PAST_ACTIVITIES_PAGE_SIZE = 5
+NOTIFICATIONS_PAGE_SIZE = 20
+# read notifications and broadcasts older than this are removed by purge_notifications, a
+# broadcast counts as read once every active user has seen or dismissed it
+NOTIFICATION_RETENTION_DAYS = 90
+# the store catalog is cached until an item changes, the timeout only bounds staleness from
+# edits made outside the views and the admin
+STORE_CACHE_TIMEOUT = 3600
 
 # Application definition
 
@@ -115,6 +132,13 @@ DATABASES = {
     "default": env.dj_db_url("DATABASE_URL", default=f"sqlite:///db.sqlite3"),
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# must be shared by all workers (e.g. file:// or redis://) for invalidation to reach every process
+CACHES = {
+    "default": env.dj_cache_url("CACHE_URL", default="locmem://"),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -182,6 +206,11 @@ else:
     }
     EMAIL_BACKEND = "anymail.backends.mailjet.EmailBackend"
     DEFAULT_FROM_EMAIL = "noreply@engage.bogz.dev"
+# recipients per ESP batch send (Mailjet accepts up to 50 messages per call)
+BULK_EMAIL_BATCH_SIZE = 50
+# a failed outbox email is retried after 30s, 60s, 120s... and given up on after this many tries
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE = 30
 
 
 AUTH_USER_MODEL = "accounts.CustomUser"  # new
@@ -0,0 +1,27 @@
+from django import template
+from engage import images
+
+register = template.Library()
+
+# widths offered for photos that stretch with the page, from phones up to the 2x desktop layout
+PHOTO_WIDTHS = (480, 768, 1152, 1536)
+
+
+@register.filter
+def square(url, size):
+    return images.square_url(url, int(size))
+
+
+@register.filter
+def square_srcset(url, size):
+    return images.square_srcset(url, int(size))
+
+
+@register.filter
+def photo(url, width=768):
+    return images.cloudinary_url(url, int(width), crop="limit")
+
+
+@register.filter
+def photo_srcset(url):
+    return images.width_srcset(url, PHOTO_WIDTHS)
@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from accounts.models import CustomUser
+from .models import Activity
+
+
+# shared by the apps' tests.py
+
+# pages render without running collectstatic first
+plain_static_files = override_settings(STORAGES={**settings.STORAGES, "staticfiles": {
+    "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+}})
+
+
+def make_user(email, **fields):
+    return CustomUser.objects.create_user(email=email, password="x", first_name="Test", last_name="User", **fields)
+
+
+def make_activity(creator, points=10, **fields):
+    now = timezone.now()
+    return Activity.objects.create(
+        title="Beach cleanup", description="", creator=creator, address="", latitude=0, longitude=0,
+        event_date=now, end_date=now + timedelta(hours=2), points=points, is_approved=True, **fields
+    )
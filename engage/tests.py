@@ -0,0 +1,192 @@
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.db import IntegrityError
+from django.core.mail.backends.locmem import EmailBackend
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from accounts.models import CustomUser
+from .attendance import award_attendees, claim_participation
+from .images import cloudinary_url, square_srcset, square_url, width_srcset
+from .mail import claim_due, queue_bulk_mail, queue_mail, release_stuck, send_claimed
+from .models import OutboundEmail, PointsTransaction, UserParticipated, UserScore
+from .testing import make_activity, make_user
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE=30)
+class OutboxTests(TestCase):
+    def test_claim_due_takes_only_pending_rows_that_are_due(self):
+        due = queue_mail("Due", "body", "from@example.com", ["a@example.com"])
+        later = queue_mail("Later", "body", "from@example.com", ["a@example.com"])
+        OutboundEmail.objects.filter(pk=later.pk).update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        sending = queue_mail("Sending", "body", "from@example.com", ["a@example.com"])
+        OutboundEmail.objects.filter(pk=sending.pk).update(status=OutboundEmail.SENDING)
+
+        claimed = claim_due(10)
+
+        self.assertEqual([email.pk for email in claimed], [due.pk])
+        self.assertEqual(OutboundEmail.objects.get(pk=due.pk).status, OutboundEmail.SENDING)
+        # a second worker polling right after finds nothing left to claim
+        self.assertEqual(claim_due(10), [])
+
+    def test_claim_due_respects_the_limit_oldest_first(self):
+        emails = [queue_mail(f"Email {n}", "body", "from@example.com", ["a@example.com"]) for n in range(3)]
+        self.assertEqual([email.pk for email in claim_due(2)], [emails[0].pk, emails[1].pk])
+
+    def test_release_stuck_requeues_rows_left_sending(self):
+        email = queue_mail("Stuck", "body", "from@example.com", ["a@example.com"])
+        claim_due(10)
+        self.assertEqual(release_stuck(), 1)
+        self.assertEqual(OutboundEmail.objects.get(pk=email.pk).status, OutboundEmail.PENDING)
+
+    def test_send_claimed_marks_rows_sent(self):
+        queue_mail("Hello", "body", "from@example.com", ["a@example.com", "b@example.com"])
+        self.assertEqual(send_claimed(claim_due(10)), (1, 0))
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.SENT, 1))
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(mail.outbox[0].to, ["a@example.com", "b@example.com"])
+
+    def test_bulk_mail_gives_every_recipient_their_own_copy(self):
+        with self.settings(BULK_EMAIL_BATCH_SIZE=2):
+            queue_bulk_mail("News", "body", "from@example.com", ["a@example.com", "b@example.com", "c@example.com"])
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+        self.assertEqual(send_claimed(claim_due(10)), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["a@example.com", "b@example.com", "c@example.com"])
+
+    def test_failed_send_backs_off_exponentially_then_gives_up(self):
+        email = queue_mail("Hello", "body", "from@example.com", ["a@example.com"])
+        with mock.patch.object(EmailBackend, "send_messages", side_effect=OSError("provider down")):
+            for attempt, delay in ((1, 30), (2, 60)):
+                before = timezone.now()
+                self.assertEqual(send_claimed(claim_due(10)), (0, 1))
+                email.refresh_from_db()
+                self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, attempt))
+                self.assertEqual(email.last_error, "provider down")
+                self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=delay))
+                self.assertLessEqual(email.next_attempt_at, timezone.now() + timedelta(seconds=delay))
+                # not due again until the backoff has passed
+                self.assertEqual(claim_due(10), [])
+                OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            with self.assertLogs("engage.mail", "ERROR"):
+                send_claimed(claim_due(10))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 3))
+        self.assertEqual(claim_due(10), [])
+        self.assertEqual(mail.outbox, [])
+
+    def test_connection_failure_retries_the_whole_chunk(self):
+        queue_mail("One", "body", "from@example.com", ["a@example.com"])
+        queue_mail("Two", "body", "from@example.com", ["b@example.com"])
+        with mock.patch.object(EmailBackend, "open", side_effect=OSError("connection refused")):
+            self.assertEqual(send_claimed(claim_due(10)), (0, 2))
+        self.assertEqual(
+            list(OutboundEmail.objects.values_list("status", "attempts", "last_error")),
+            [(OutboundEmail.PENDING, 1, "connection refused")] * 2,
+        )
+        self.assertEqual(claim_due(10), [])
+
+    def test_one_failure_does_not_stop_the_rest_of_the_chunk(self):
+        queue_mail("Fails", "body", "from@example.com", ["a@example.com"])
+        queue_mail("Works", "body", "from@example.com", ["b@example.com"])
+        send_messages = EmailBackend.send_messages
+
+        def fail_first(backend, messages):
+            if messages[0].subject == "Fails":
+                raise OSError("rejected")
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, "send_messages", fail_first):
+            self.assertEqual(send_claimed(claim_due(10)), (1, 1))
+        self.assertEqual([message.subject for message in mail.outbox], ["Works"])
+
+
+UPLOAD = "https://res.cloudinary.com/demo/image/upload/v1712/folder/photo.jpg"
+
+
+class ImageTests(TestCase):
+    def test_transformation_goes_right_after_the_upload_marker(self):
+        self.assertEqual(
+            square_url(UPLOAD, 64),
+            "https://res.cloudinary.com/demo/image/upload/w_64,h_64,c_fill,f_auto,q_auto/v1712/folder/photo.jpg",
+        )
+        self.assertEqual(
+            cloudinary_url(UPLOAD, 768, crop="limit"),
+            "https://res.cloudinary.com/demo/image/upload/w_768,c_limit,f_auto,q_auto/v1712/folder/photo.jpg",
+        )
+
+    def test_other_urls_pass_through(self):
+        for url in ("", None, "/static/icons/default_profile.svg", "https://example.com/image/upload/photo.jpg",
+                    "https://res.cloudinary.com/demo/video/upload/v1/clip.mp4"):
+            self.assertEqual(square_url(url, 64), url)
+            self.assertEqual(square_srcset(url, 64), "")
+            self.assertEqual(width_srcset(url, (480, 768)), "")
+
+    def test_srcsets(self):
+        self.assertEqual(square_srcset(UPLOAD, 32), ", ".join(
+            f"{square_url(UPLOAD, size)} {density}x" for size, density in ((32, 1), (64, 2), (96, 3))
+        ))
+        self.assertEqual(width_srcset(UPLOAD, (480, 768)), ", ".join(
+            f"{cloudinary_url(UPLOAD, width, crop='limit')} {width}w" for width in (480, 768)
+        ))
+
+    def test_template_filters(self):
+        rendered = Template(
+            "{% load images %}{{ url|square:'40' }}|{{ url|square_srcset:40 }}|{{ url|photo }}|{{ url|photo:480 }}|{{ url|photo_srcset }}"
+        ).render(Context({"url": UPLOAD}))
+        self.assertEqual(rendered.split("|"), [
+            square_url(UPLOAD, 40),
+            square_srcset(UPLOAD, 40),
+            cloudinary_url(UPLOAD, 768, crop="limit"),
+            cloudinary_url(UPLOAD, 480, crop="limit"),
+            width_srcset(UPLOAD, (480, 768, 1152, 1536)),
+        ])
+
+
+class ClaimTests(TestCase):
+    def setUp(self):
+        self.user = make_user("a@example.com")
+        self.activity = make_activity(self.user)
+
+    def assertPaidOnce(self, user):
+        user.refresh_from_db()
+        self.assertEqual(UserParticipated.objects.filter(user=user, activity=self.activity).count(), 1)
+        self.assertEqual(PointsTransaction.objects.filter(user=user, activity=self.activity).count(), 1)
+        self.assertEqual((user.balance, user.lifetime_points), (10, 10))
+        self.assertEqual(UserScore.objects.get(user=user, leaderboard__isnull=True).points, 10)
+
+    def test_second_claim_pays_nothing(self):
+        self.assertTrue(claim_participation(self.user, self.activity))
+        self.assertFalse(claim_participation(CustomUser.objects.get(pk=self.user.pk), self.activity))
+        self.assertPaidOnce(self.user)
+
+    def test_database_rejects_a_duplicate_participation(self):
+        UserParticipated.objects.create(user=self.user, activity=self.activity)
+        with self.assertRaises(IntegrityError):
+            UserParticipated.objects.create(user=self.user, activity=self.activity)
+
+    def test_attendance_list_skips_users_who_already_claimed(self):
+        other = make_user("b@example.com")
+        claim_participation(self.user, self.activity)
+        awarded, skipped, unknown = award_attendees(self.activity, ["A@example.com", "b@example.com", "c@example.com"])
+        self.assertEqual([user.pk for user in awarded], [other.pk])
+        self.assertEqual(skipped, ["a@example.com"])
+        self.assertEqual(unknown, ["c@example.com"])
+        self.assertPaidOnce(self.user)
+        self.assertPaidOnce(other)
+        # and a claim after being on the list pays nothing either
+        self.assertFalse(claim_participation(other, self.activity))
+        self.assertPaidOnce(other)
+
+    def test_claim_failing_after_the_insert_leaves_no_claim(self):
+        with mock.patch("engage.attendance.credit_participation", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                claim_participation(self.user, self.activity)
+        self.user.refresh_from_db()
+        self.assertFalse(UserParticipated.objects.exists())
+        self.assertFalse(PointsTransaction.objects.exists())
+        self.assertEqual(self.user.balance, 0)
+        # so claiming again still works
+        self.assertTrue(claim_participation(self.user, self.activity))
+        self.assertPaidOnce(self.user)
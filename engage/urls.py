@@ -54,6 +54,7 @@ urlpatterns = [
     path("bookmark_activity/<int:pk>/", views.bookmark_activity, name="bookmark_activity"),
     path("load-more-activities/", views.load_more_activities, name="load_more_activities"),
     path("award_participation_points/<int:pk>/", views.award_participation_points, name="award_participation_points"),
+    path("bulk_award_points/<int:pk>/", views.bulk_award_points, name="bulk_award_points"),
     path("edit_activity/<int:pk>/", views.edit_activity, name="edit_activity"),
     path("update_activity/<int:pk>/", views.update_activity, name="update_activity"),
     path("delete_activity/<int:pk>/", views.delete_activity, name="delete_activity"),
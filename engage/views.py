@@ -1,20 +1,30 @@
-from .models import Team, Activity, Leaderboard, Item, UserParticipated, Notification
+from .models import Team, Activity, Leaderboard, Item, UserParticipated
+from .activities import ongoing, past_activities
+from .attendance import attendee_emails, award_attendees, claim_participation
+from .catalog import catalog_items, invalidate_catalog, store_etag
+from .mail import queue_bulk_mail
+from .notifications import notify_everyone
+from .points import reverse_participation
+from .scores import rebuild_scores, update_team_rankings, invalidate_leaderboards
 from notifications.views import *
 from accounts.models import CustomUser
 from django.db.models import Count, Exists, OuterRef
 from django.db.models.functions import TruncDay
 from django.http import JsonResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.http import JsonResponse, HttpResponse
 import cloudinary.uploader
 from datetime import datetime, timedelta
 from django.contrib.auth.decorators import login_required
 import dateutil.parser
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 from django.urls import reverse
-from django.core.mail import send_mail
-from django.db.models import Sum, Q
+from django.db.models import Q
 
 
 class ServiceWorker(TemplateView):
@@ -26,6 +36,34 @@ def offline(request):
     return render(request, "offline.html")
 
 
+def with_viewer_state(activities, user):
+    # annotate what the activity cards need to know about the viewer and prefetch the
+    # leaderboards, so a card renders without querying its relations again
+    interested = Activity.interested_users.through.objects.filter(
+        activity=OuterRef("pk"), customuser=user
+    )
+    participated = UserParticipated.objects.filter(activity=OuterRef("pk"), user=user)
+    return activities.annotate(
+        user_is_interested=Exists(interested),
+        user_has_participated=Exists(participated),
+    ).prefetch_related("leaderboards")
+
+
+def past_activities_page(activities, user, before_date=None, before_id=None):
+    # keyset pagination, newest first: a page continues strictly after the (event_date, id)
+    # of the last card shown, so deep pages stay cheap and expiring activities can't shift it
+    if before_date is not None and before_id is not None:
+        activities = activities.filter(
+            Q(event_date__lt=before_date) | Q(event_date=before_date, id__lt=before_id)
+        )
+    page_size = settings.PAST_ACTIVITIES_PAGE_SIZE
+    # one extra row tells whether there is another page
+    page = list(
+        with_viewer_state(activities, user).order_by("-event_date", "-id")[:page_size + 1]
+    )
+    return page[:page_size], len(page) > page_size
+
+
 def home(request):
     if not request.user.is_authenticated:
         return redirect("send_login_link")
@@ -72,13 +110,14 @@ def home(request):
         tomorrow_activities = []
         upcoming_activities = []
         recent_past_activities = []
+        has_more_past = False
 
         # filter activities by date if query_date is present
         query_date = request.GET.get("query_date", None)
         if query_date is not None:
-            activities = Activity.objects.filter(event_date__date=query_date).order_by(
-                "event_date"
-            )
+            activities = with_viewer_state(
+                Activity.objects.filter(event_date__date=query_date), request.user
+            ).order_by("event_date")
             # format in 'A, d, B' format
             query_date = datetime.strptime(query_date, "%Y-%m-%d").strftime("%A, %d %B")
         else:
@@ -86,26 +125,21 @@ def home(request):
             tomorrow = today + timedelta(days=1)
             upcoming_start = tomorrow + timedelta(days=1)
 
+            now = timezone.now()
+            # activities that ended but weren't expired by the job yet already count as past
+            activities = with_viewer_state(ongoing(activities, now), request.user)
             today_activities = activities.filter(event_date__date=today.date())
             tomorrow_activities = activities.filter(event_date__date=tomorrow.date())
             upcoming_activities = activities.filter(
                 event_date__date__gte=upcoming_start.date()
             )
 
-            user_participations = UserParticipated.objects.filter(
-                activity=OuterRef("pk"), user=request.user
-            )
-
-            # Fetch 10 most recent past activities
-            recent_past_activities = (
-                Activity.objects.filter(is_approved=True, event_date__lt=datetime.now())
-                .order_by("-event_date")[:5]
-                .annotate(user_has_participated=Exists(user_participations))
+            # Fetch the most recent past activities
+            recent_past_activities, has_more_past = past_activities_page(
+                past_activities(now),
+                request.user,
             )
-
-            for activity in recent_past_activities:
-                activity.is_active = False
-                activity.save()
+            # finished activities are marked inactive by the expire_activities job
             activities = None
 
         # update context
@@ -116,6 +150,7 @@ def home(request):
             "upcoming_activities": upcoming_activities,
             "dates_with_activities": dates_with_activities,
             "recent_past_activities": recent_past_activities,
+            "has_more_past": has_more_past,
             "query_date": query_date,
         }
         return render(request, "home.html", context)
@@ -129,12 +164,18 @@ def add_activity(request):
 
 
 def bookmark_activity(request, pk):
-    activity = Activity.objects.get(pk=pk)
     user = request.user
-    if user in activity.interested_users.all():
-        activity.interested_users.remove(user)
+    # one query tells whether the viewer had participated, the toggle itself only touches
+    # the viewer's row of the through table, however many others are interested
+    activity = with_viewer_state(Activity.objects.filter(pk=pk), user).get()
+    interested = Activity.interested_users.through.objects.filter(activity_id=pk, customuser=user)
+    if interested.delete()[0]:
+        activity.user_is_interested = False
     else:
-        activity.interested_users.add(user)
+        Activity.interested_users.through.objects.bulk_create(
+            [Activity.interested_users.through(activity_id=pk, customuser=user)], ignore_conflicts=True
+        )
+        activity.user_is_interested = True
     if request.GET.get("from_activity_page"):
         return render(request, "partials/activity_header.html", {"activity": activity})
     else:
@@ -142,9 +183,7 @@ def bookmark_activity(request, pk):
 
 
 def leave_activity(request, pk):
-    activity = Activity.objects.get(pk=pk)
-    user = request.user
-    activity.interested_users.remove(user)
+    Activity.interested_users.through.objects.filter(activity_id=pk, customuser=request.user).delete()
     return redirect("profile")
 
 
@@ -197,18 +236,21 @@ def update_activity(request, pk):
         activity.photo = uploaded_image_url
         activity.leaderboards.clear()
         activity.leaderboards.add(*leaderboards)
+        # points and leaderboards count retroactively, so participants' scores are rebuilt below
+        participant_ids = list(
+            UserParticipated.objects.filter(activity=activity).values_list("user_id", flat=True)
+        )
 
         event_date_naive = dateutil.parser.parse(event_date)
         event_date_aware = timezone.make_aware(event_date_naive, timezone.get_default_timezone())
         if event_date_aware > timezone.now():
             activity.is_active = True
-            for user in activity.participated_users.all():
-                user.balance -= activity.points
-                user.lifetime_points -= activity.points
-                user.save()
-                activity.participated_users.remove(user)
+            # rescheduled into the future, so every claim is refunded and undone
+            reverse_participation(activity)
 
         activity.save()
+        if participant_ids:
+            rebuild_scores(participant_ids)
         redirect_url = reverse("activity", args=[activity.pk])
         response = HttpResponse("Redirecting...")
         response["HX-Redirect"] = redirect_url
@@ -218,7 +260,12 @@ def update_activity(request, pk):
 def delete_activity(request, pk):
     if request.method == "DELETE" and request.user.is_staff:
         activity = Activity.objects.get(pk=pk)
+        participant_ids = list(
+            UserParticipated.objects.filter(activity=activity).values_list("user_id", flat=True)
+        )
         activity.delete()
+        if participant_ids:
+            rebuild_scores(participant_ids)
         return redirect("home")
 
 
@@ -230,52 +277,37 @@ def approve_activity(request, pk):
         activity.is_approved = True
         activity.save()
 
-        # Fetch all users to notify them about the approval
-        users = (
-            CustomUser.objects.all()
-        )  # Consider excluding the activity creator if needed
-
         activity_url = request.build_absolute_uri(
             reverse("activity", args=[activity.pk])
         )
 
-        # Create a notification for each user
-        notifications = [
-            Notification(
-                recipient=user,
-                title=f"New Activity Posted: {activity.title}",
-                message=f"The activity titled '<a href=\"{activity_url}\">{activity.title}</a>' has been approved and is now live!",
-                read=False,
-            )
-            for user in users
-        ]
-        Notification.objects.bulk_create(
-            notifications
-        )  # Use bulk_create for efficiency
+        # one broadcast notification for everyone, rather than a row per user
+        notify_everyone(
+            f"New Activity Posted: {activity.title}",
+            f"The activity titled '<a href=\"{activity_url}\">{activity.title}</a>' has been approved and is now live!",
+        )
 
         # Redirect to the homepage or another appropriate page
         return redirect("home")
 
 
 def load_more_activities(request):
-    offset = int(request.GET.get("offset", 0))
-    next_offset = offset + 5
-    user_participations = UserParticipated.objects.filter(
-        activity=OuterRef("pk"), user=request.user
-    )
-    past_activities = (
-        Activity.objects.filter(is_approved=True, is_active=False)
-        .order_by("-event_date")[offset:next_offset]
-        .annotate(user_has_participated=Exists(user_participations))
+    before_date = parse_datetime(request.GET.get("before", ""))
+    before_id = request.GET.get("before_id")
+    page, has_more = past_activities_page(
+        past_activities(),
+        request.user,
+        before_date,
+        int(before_id) if before_id and before_id.isdigit() else None,
     )
-    if not past_activities or len(past_activities) < 5:
-        return render(
-            request,
-            "partials/past_activities.html",
-            {"past_activities": past_activities, "no_more_activities": True},
-        )
     return render(
-        request, "partials/past_activities.html", {"past_activities": past_activities}
+        request,
+        "partials/past_activities.html",
+        {
+            "past_activities": page,
+            "has_more": has_more,
+            "no_more_activities": not has_more,
+        },
     )
 
 
@@ -326,7 +358,9 @@ def new_activity(request):
             if alert:
                 # Fetch all users to notify them about the new activity
                 creator = creator.first_name + " " + creator.last_name
-                users = CustomUser.objects.filter(is_staff=False, is_active=True)
+                recipients = list(
+                    CustomUser.objects.filter(is_staff=False, is_active=True).values_list("email", flat=True)
+                )
                 activity_url = request.build_absolute_uri(reverse('activity', args=[activity.pk]))
                 subject = 'Important activity added to Engage'
                 message = 'Hello!\n' + creator + ' just added a new activity titled "' \
@@ -335,9 +369,8 @@ def new_activity(request):
                             + '"' + description + '"\nCheck it out <a href="' \
                             + activity_url + '">here</a>.'
                 from_email = 'noreply@engage.bogz.dev'
-                # Send an email about the activity to each user
-                for user in users:
-                    send_mail(subject, message, from_email, [user.email])
+                # Queue an email about the activity to each user for the send_outbox worker
+                queue_bulk_mail(subject, message, from_email, recipients)
 
         redirect_url = reverse("activity", args=[activity.pk])
         response = HttpResponse("Redirecting...")
@@ -350,14 +383,10 @@ def new_activity(request):
 def activity(request, pk):
     if not request.user.is_authenticated:
         return redirect("send_login_link")
-    try:
-        activity = Activity.objects.get(pk=pk)
-    except Activity.DoesNotExist:
+    activity = with_viewer_state(Activity.objects.filter(pk=pk), request.user).first()
+    if activity is None:
         return redirect("home")
-    other_interested_users = activity.interested_users.all().exclude(pk=request.user.pk)
-    activity.user_has_participated = activity.participated_users.filter(
-        pk=request.user.pk
-    ).exists()
+    other_interested_users = list(activity.interested_users.exclude(pk=request.user.pk))
     return render(
         request,
         "activity.html",
@@ -380,34 +409,37 @@ def additional_users(request, pk):
 def award_participation_points(request, pk):
     user = request.user
     activity = Activity.objects.get(pk=pk)
-    if user in activity.participated_users.all():
+    if not claim_participation(user, activity):
         return JsonResponse(
             {"error": "User has already been awarded points for this activity"}
         )
     else:
-        user.balance += activity.points
-        user.lifetime_points += activity.points
-        user.save()
-        activity.participated_users.add(user)
         activity.user_has_participated = True
+        # only interested users can claim
+        activity.user_is_interested = True
         update_team_rankings()
         if request.GET.get("from_activity_page"):
             return render(request, "partials/activity_header.html", {"activity": activity})
         else:
             return render(request, "partials/activity_card.html", {"activity": activity})
 
-def update_team_rankings():
-    teams = Team.objects.all()
-    now = timezone.now()
-    start_date = timezone.make_aware(datetime(now.year, now.month, 1))
-    user_participations = UserParticipated.objects.filter(date_participated__gte=start_date)
-    teams = Team.objects.annotate(
-            team_points=Sum('member__userparticipated__activity__points', filter=Q(member__userparticipated__in=user_participations))
-        ).order_by('-team_points')
-    # save order of each team in team.monthly rank based on order in teams
-    for i, team in enumerate(teams):
-        team.monthly_rank = i+1
-        team.save()        
+
+@login_required
+def bulk_award_points(request, pk):
+    # staff paste or upload an attendance list and everyone on it is paid in one go,
+    # instead of every attendee claiming on their own
+    if request.method != "POST" or not request.user.is_staff:
+        return redirect("activity", pk=pk)
+    activity = Activity.objects.get(pk=pk)
+    lines = request.POST.get("attendees", "").splitlines()
+    if "attendees_csv" in request.FILES:
+        lines += request.FILES["attendees_csv"].read().decode("utf-8-sig").splitlines()
+    awarded, skipped, unknown = award_attendees(activity, attendee_emails(lines))
+    return render(
+        request,
+        "partials/bulk_award_result.html",
+        {"activity": activity, "awarded": awarded, "skipped": skipped, "unknown": unknown},
+    )
 
 
 def edit_item(request, pk):
@@ -419,7 +451,8 @@ def edit_item(request, pk):
         image = cloudinary.uploader.upload(request.FILES["photo"], upload_preset="p4p2xtey")
         item.image = image["secure_url"]
     item.save()
-    items = Item.objects.all()
+    invalidate_catalog()
+    items = catalog_items().values()
     user = request.user
     return render(request, "store.html", {"items": items, "user": user})
 
@@ -427,6 +460,7 @@ def edit_item(request, pk):
 def delete_item(request, pk):
     item = Item.objects.get(pk=pk)
     item.delete()
+    invalidate_catalog()
     return redirect("store")
 
 
@@ -446,7 +480,8 @@ def new_item(request):
         uploaded_image_url = uploaded_image["secure_url"]
         item = Item.objects.create(name=name, description=description, price=points, image=uploaded_image_url)
         item.save()
-    items = Item.objects.all()
+        invalidate_catalog()
+    items = catalog_items().values()
     return render(request, "store.html", {"items": items})
 
 
@@ -459,17 +494,22 @@ def add_item(request):
         return redirect("home")
 
 
+# revalidated on every visit, a repeat visit to an unchanged page gets a 304
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=store_etag)
 def item(request, pk):
     if not request.user.is_authenticated:
         return redirect("send_login_link")
-    item = Item.objects.get(pk=pk)
+    item = catalog_items().get(pk) or Item.objects.get(pk=pk)
     return render(request, "item_details.html", {"item": item})
 
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=store_etag)
 def store(request):
     if not request.user.is_authenticated:
         return redirect("send_login_link")
-    items = Item.objects.all()
+    items = catalog_items().values()
     return render(request, "store.html", {"items": items})
 
 
@@ -490,11 +530,11 @@ def profile(request, pk=None):
     interested = Activity.objects.filter(
         interested_users=user, is_approved=True
     ).order_by("event_date")
-    interested = interested.exclude(participated_users=user)
+    interested = list(interested.exclude(participated_users=user))
     # true if user is interested  in any activity that is active
-    participated = Activity.objects.filter(
+    participated = list(Activity.objects.filter(
         participated_users=user, is_active=False
-    ).order_by("-event_date")[:5]
+    ).order_by("-event_date")[:5])
     return render(
         request,
         "profile.html",
@@ -552,8 +592,11 @@ def edit_profile(request):
                 # This part is up to you depending on how you handle profile picture uploads
                 pass
 
-            # Save the updated user information
-            user.save()
+            # Save only the profile fields, the points and notification counters on this
+            # request's copy of the user may be stale by now
+            user.save(update_fields=["email", "first_name", "last_name", "position", "description", "profile_picture"])
+            # names and pictures are part of the cached leaderboard rows
+            invalidate_leaderboards()
 
             # Redirect to the profile page or any other appropriate page
             return redirect("profile")
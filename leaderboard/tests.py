@@ -1,3 +1,96 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from engage.models import Team, UserScore
+from engage.scores import credit_participation, month_start, previous_month, refresh_team_points, update_team_rankings
+from engage.testing import make_activity, make_user, plain_static_files
 
-# Create your tests here.
+
+@plain_static_files
+class TeamRankTests(TestCase):
+    def setUp(self):
+        self.users = [make_user(f"user{n}@example.com") for n in range(3)]
+        self.teams = []
+        for n, user in enumerate(self.users):
+            team = Team.objects.create(name=f"Team {n}", leader=user)
+            team.member.add(user)
+            self.teams.append(team)
+
+    def ranks(self):
+        return {team.name: (team.monthly_points, team.monthly_rank) for team in Team.objects.all()}
+
+    def test_claims_add_to_team_points_and_rerank(self):
+        credit_participation(self.users[1], make_activity(self.users[0], 20))
+        credit_participation(self.users[2], make_activity(self.users[0], 10))
+        update_team_rankings()
+        self.assertEqual(self.ranks(), {"Team 0": (0, 3), "Team 1": (20, 1), "Team 2": (10, 2)})
+
+        credit_participation(self.users[2], make_activity(self.users[0], 15))
+        update_team_rankings()
+        self.assertEqual(self.ranks(), {"Team 0": (0, 3), "Team 1": (20, 2), "Team 2": (25, 1)})
+
+    def test_ties_are_broken_by_team_id(self):
+        update_team_rankings()
+        self.assertEqual([team.monthly_rank for team in Team.objects.order_by("id")], [1, 2, 3])
+
+    def test_only_moved_ranks_are_written(self):
+        update_team_rankings()
+        # the savepoint, the month roll and one read: nothing is written when no rank changed
+        with self.assertNumQueries(4):
+            update_team_rankings()
+        credit_participation(self.users[2], make_activity(self.users[0], 5))
+        update_team_rankings()
+        self.assertEqual([team.monthly_rank for team in Team.objects.order_by("id")], [2, 3, 1])
+
+    def test_a_new_month_starts_every_team_from_zero(self):
+        Team.objects.update(monthly_points=50, points_month=previous_month())
+        credit_participation(self.users[0], make_activity(self.users[0], 5))
+        self.assertEqual(
+            list(Team.objects.order_by("id").values_list("monthly_points", "points_month")),
+            [(5, month_start()), (0, month_start()), (0, month_start())],
+        )
+
+    def test_joining_and_leaving_moves_the_member_points(self):
+        credit_participation(self.users[2], make_activity(self.users[0], 30))
+        self.teams[2].member.remove(self.users[2])
+        self.teams[0].member.add(self.users[2])
+        refresh_team_points([self.teams[0].pk, self.teams[2].pk])
+        self.assertEqual(self.ranks(), {"Team 0": (30, 1), "Team 1": (0, 2), "Team 2": (0, 3)})
+
+    def test_join_and_leave_views_rerank(self):
+        credit_participation(self.users[2], make_activity(self.users[0], 30))
+        self.client.force_login(self.users[2])
+        self.client.post(reverse("leave_team", args=[self.teams[2].pk]))
+        self.assertEqual(self.ranks()["Team 2"], (0, 3))
+        self.client.post(reverse("join_team"), {"team_id": self.teams[1].pk})
+        self.assertEqual(self.ranks(), {"Team 0": (0, 2), "Team 1": (30, 1), "Team 2": (0, 3)})
+
+    def test_claim_view_reranks(self):
+        activity = make_activity(self.users[0], 10)
+        self.client.force_login(self.users[2])
+        self.client.post(reverse("award_participation_points", args=[activity.pk]))
+        self.assertEqual(self.ranks()["Team 2"], (10, 1))
+        self.assertEqual(UserScore.objects.get(user=self.users[2], leaderboard__isnull=True).points, 10)
+
+
+@plain_static_files
+@override_settings(LEADERBOARD_PAGE_SIZE=2)
+class MoreLeaderboardUsersTests(TestCase):
+    def setUp(self):
+        self.users = [make_user(f"user{n}@example.com") for n in range(5)]
+        for points, user in enumerate(self.users, start=1):
+            credit_participation(user, make_activity(self.users[0], points * 10))
+        self.client.force_login(self.users[0])
+
+    def test_pages_through_the_ranking(self):
+        response = self.client.get(reverse("more_leaderboard_users"), {"after": 1, "total": 1000})
+        self.assertEqual([user["rank"] for user in response.context["users"]], [2, 3])
+        # the total is the ranking's own, whatever the page sent
+        self.assertEqual(response.context["total_users"], 5)
+        self.assertEqual(response.context["more_after"], 3)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({"after": "x"}, {"before": "-1"}, {"leaderboard_id": "all"}):
+            self.assertEqual(self.client.get(reverse("more_leaderboard_users"), params).status_code, 400)
+
+    def test_unknown_leaderboard(self):
+        self.assertEqual(self.client.get(reverse("more_leaderboard_users"), {"leaderboard_id": 999}).status_code, 404)
@@ -3,6 +3,7 @@ from .views import *
 
 urlpatterns = [
     path("", leaderboard, name="leaderboard"),
+    path("more/", more_leaderboard_users, name="more_leaderboard_users"),
     path('teams/detail/<int:team_id>/', team_detail, name='team_detail'),
     path('teams/edit/<int:team_id>/', edit_team, name='edit_team'),
     path('teams/', list_teams, name='list_teams'),
@@ -1,15 +1,98 @@
-from engage.models import Team, Leaderboard, UserParticipated
+from engage.models import Team, Leaderboard, TeamScoreSnapshot, UserScore, UserScoreSnapshot
+from engage.scores import month_start, previous_month, refresh_team_points, update_team_rankings, leaderboard_version, invalidate_leaderboards
 from leaderboard.forms import JoinTeamForm
 from notifications.views import *
-from django.db.models import Sum, Q
-from django.utils import timezone
+from django.db.models import Count, F, Max, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, redirect, get_object_or_404
 import cloudinary.uploader
-from datetime import datetime
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseBadRequest, HttpResponseRedirect
 from django.urls import reverse
 
+
+def period_scores(leaderboard_id, date_filter):
+    # read the monthly score rollups instead of aggregating every participation
+    scores = UserScore.objects.filter(leaderboard_id=leaderboard_id or None)
+    this_month = month_start()
+    if date_filter == 'this_month':
+        scores = scores.filter(month=this_month)
+    elif date_filter == 'last_month':
+        scores = scores.filter(month=previous_month(this_month))
+    elif date_filter == 'this_year':
+        scores = scores.filter(month__gte=this_month.replace(month=1))
+    return scores
+
+
+def is_closed(month):
+    return UserScoreSnapshot.objects.filter(month=month).exists()
+
+
+def user_rankings(leaderboard_id, date_filter):
+    if date_filter == 'last_month' and is_closed(previous_month()):
+        # closed months are read straight from their snapshot
+        return UserScoreSnapshot.objects.filter(
+            month=previous_month(), leaderboard_id=leaderboard_id or None
+        ).values(
+            'user__id', 'user__first_name', 'user__last_name', 'user__profile_picture', 'rank'
+        ).annotate(
+            total_points=F('points')
+        ).order_by('rank')
+    # per-user totals with their position computed by the database, ties broken by user id
+    return period_scores(leaderboard_id, date_filter).values(
+        'user__id', 'user__first_name', 'user__last_name', 'user__profile_picture'
+    ).annotate(
+        total_points=Sum('points')
+    ).annotate(
+        rank=Window(RowNumber(), order_by=[F('total_points').desc(), F('user__id').asc()])
+    ).order_by('rank')
+
+
+def ranked_rows(leaderboard_mode, leaderboard_id, date_filter):
+    # rankings are the same for every viewer, so they're cached per mode, board and period
+    # and dropped by engage.scores.invalidate_leaderboards whenever scores change
+    period = date_filter if date_filter in ('this_month', 'last_month', 'this_year') else 'all_time'
+    key = f'leaderboard:{leaderboard_version()}:{leaderboard_mode}:{leaderboard_id or "all"}:{period}'
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    if leaderboard_mode == 'team' and period == 'last_month' and is_closed(previous_month()):
+        snapshots = TeamScoreSnapshot.objects.filter(
+            month=previous_month(), leaderboard_id=leaderboard_id or None
+        ).values(
+            'team_id', 'team__name', 'team__leader__first_name', 'team__leader__last_name', 'points'
+        ).annotate(member_count=Count('team__member')).order_by('rank')
+        rows = [
+            {
+                'id': snapshot['team_id'],
+                'name': snapshot['team__name'],
+                'leader__first_name': snapshot['team__leader__first_name'],
+                'leader__last_name': snapshot['team__leader__last_name'],
+                'team_points': snapshot['points'],
+                'member_count': snapshot['member_count'],
+            }
+            for snapshot in snapshots
+        ]
+        total = len(rows)
+    elif leaderboard_mode == 'team':
+        rows = list(Team.objects.values(
+            'id', 'name', 'leader__first_name', 'leader__last_name'
+        ).annotate(
+            team_points=Sum('member__scores__points', filter=Q(member__scores__in=period_scores(leaderboard_id, period))),
+            member_count=Count('member', distinct=True),
+        ).filter(team_points__gt=0).order_by('-team_points'))
+        total = len(rows)
+    else:
+        # only the top of the individual ranking is rendered up front
+        rankings = user_rankings(leaderboard_id, period)
+        rows = list(rankings[:settings.LEADERBOARD_TOP_N])
+        total = rankings.count() if len(rows) == settings.LEADERBOARD_TOP_N else len(rows)
+    cache.set(key, (rows, total), settings.LEADERBOARD_CACHE_TIMEOUT)
+    return rows, total
+
+
 def leaderboard(request):
     if not request.user.is_authenticated:
         return redirect('send-login-link')
@@ -19,47 +102,76 @@ def leaderboard(request):
     date_filter = request.GET.get('date_filter', 'this_month')
 
     leaderboards = Leaderboard.objects.all()
-    now = timezone.now()
-    start_date = datetime(now.year, now.month, 1) if date_filter == "this_month" else datetime(now.year, 1, 1)
     context = {
         'leaderboard_mode': leaderboard_mode,
         'leaderboards': leaderboards,
         'selected_leaderboard': selected_leaderboard,
         'date_filter': date_filter,
+        'last_month': previous_month(),
     }
-
     if leaderboard_mode == 'individual':
-        user_participations = UserParticipated.objects.filter(date_participated__gte=start_date)
-        if selected_leaderboard_id:
-            user_participations = user_participations.filter(activity__leaderboards__id=selected_leaderboard_id)
-        if start_date:
-            start_date = timezone.make_aware(start_date)
-            user_participations = user_participations.filter(date_participated__gte=start_date)
-
-        users = user_participations.values(
-            'user__id', 'user__first_name', 'user__last_name', 'user__profile_picture'
-        ).annotate(
-            total_points=Sum('activity__points')
-        ).order_by('-total_points')
+        users, total = ranked_rows(leaderboard_mode, selected_leaderboard_id, date_filter)
         context['users'] = users
-
-    elif leaderboard_mode == 'team':
-        if start_date:
-            start_date = timezone.make_aware(start_date)  # Ensure the datetime is timezone aware
-            user_participations = UserParticipated.objects.filter(date_participated__gte=start_date)
+        context['total_users'] = total
+        top_n = len(users)
+        # show the viewer where they stand when they're below the top of the ranking
+        my_window = []
+        if top_n < total and not any(user['user__id'] == request.user.id for user in users):
+            rankings = user_rankings(selected_leaderboard_id, date_filter)
+            # filtering on a window over each user's own row keeps the rank computed over everyone
+            me = rankings.annotate(
+                ranked_user_id=Window(Max('user__id'), partition_by=F('user__id'))
+            ).filter(ranked_user_id=request.user.id).first()
+            if me:
+                radius = settings.LEADERBOARD_WINDOW
+                my_window = list(rankings.filter(
+                    rank__gt=max(me['rank'] - radius - 1, top_n), rank__lte=me['rank'] + radius
+                ))
+        context['my_window'] = my_window
+        # the rest of the ranking is loaded on demand, around the viewer's window if there is one
+        if my_window:
+            context['gap_after'] = top_n if my_window[0]['rank'] > top_n + 1 else None
+            context['gap_before'] = my_window[0]['rank']
+            context['tail_after'] = my_window[-1]['rank'] if my_window[-1]['rank'] < total else None
         else:
-            user_participations = UserParticipated.objects.all()  # No date filtering for 'all time'
-
-        if selected_leaderboard_id:
-            user_participations = user_participations.filter(activity__leaderboards__id=selected_leaderboard_id)
+            context['gap_after'] = top_n if top_n < total else None
+            context['gap_before'] = total + 1
+    elif leaderboard_mode == 'team':
+        # the cached rows are shared, highlighting the viewer's own team happens per request
+        my_team_ids = set(request.user.team_member.values_list('id', flat=True))
+        teams, total = ranked_rows(leaderboard_mode, selected_leaderboard_id, date_filter)
+        context['teams'] = [dict(team, is_mine=team['id'] in my_team_ids) for team in teams]
+    return render(request, "leaderboard.html", context)
 
-        # Simplify the aggregation of points
-        teams = Team.objects.annotate(
-            team_points=Sum('member__userparticipated__activity__points', filter=Q(member__userparticipated__in=user_participations))
-        ).filter(team_points__gt=0).order_by('-team_points')       
-        context['teams'] = teams
 
-    return render(request, "leaderboard.html", context)
+def more_leaderboard_users(request):
+    if not request.user.is_authenticated:
+        return redirect('send-login-link')
+    params = [request.GET.get(name) or '' for name in ('leaderboard_id', 'after', 'before')]
+    if not all(param.isdigit() for param in params if param):
+        return HttpResponseBadRequest()
+    selected_leaderboard_id, after, before = params
+    selected_leaderboard = get_object_or_404(Leaderboard, id=selected_leaderboard_id) if selected_leaderboard_id else None
+    date_filter = request.GET.get('date_filter', 'this_month')
+    after = int(after or 0)
+    before = int(before or 0) or None
+    # the ranking's size comes from the cached ranking, not from the page that asked
+    total = ranked_rows('individual', selected_leaderboard_id, date_filter)[1]
+    rankings = user_rankings(selected_leaderboard_id, date_filter).filter(rank__gt=after)
+    if before:
+        rankings = rankings.filter(rank__lt=before)
+    users = list(rankings[:settings.LEADERBOARD_PAGE_SIZE])
+    last_rank = users[-1]['rank'] if users else after
+    # keep offering more until the gap (or the whole ranking) is filled
+    has_more = len(users) == settings.LEADERBOARD_PAGE_SIZE and last_rank + 1 < (before or total + 1)
+    return render(request, 'partials/leaderboard_users.html', {
+        'users': users,
+        'total_users': total,
+        'selected_leaderboard': selected_leaderboard,
+        'date_filter': date_filter,
+        'more_after': last_rank if has_more else None,
+        'more_before': before,
+    })
 
 
 def edit_leaderboard(request, pk):
@@ -69,12 +181,14 @@ def edit_leaderboard(request, pk):
         if request.POST.get('delete'):
             leaderboard = Leaderboard.objects.get(id=pk)
             leaderboard.delete()
+            invalidate_leaderboards()
             return redirect('leaderboard')
         else:
             leaderboard = Leaderboard.objects.get(id=pk)
             leaderboard.leaderboard_name = request.POST.get('name')
             leaderboard.leaderboard_color = request.POST.get('color')
             leaderboard.save()
+            invalidate_leaderboards()
             url = reverse('leaderboard')
             url += '?leaderboard_id=' + str(leaderboard.id)
             return HttpResponseRedirect(url)
@@ -87,13 +201,13 @@ def edit_leaderboard(request, pk):
 def list_teams(request):
     if not request.user.is_authenticated:
         return redirect('send-login-link')
-    teams = Team.objects.all()
-    on_team = False
+    teams = Team.objects.select_related('leader').annotate(member_count=Count('member'))
+    # one lookup for the viewer's teams instead of loading every team's members
+    my_team_ids = set(request.user.team_member.values_list('id', flat=True))
+    teams = list(teams)
     for team in teams:
-        if request.user in team.member.all():
-            team.is_member = True
-            on_team = True
-    return render(request, 'list_teams.html', {'teams': teams, 'on_team': on_team})
+        team.is_member = team.id in my_team_ids
+    return render(request, 'list_teams.html', {'teams': teams, 'on_team': bool(my_team_ids)})
 
 
 def create_team(request):
@@ -108,6 +222,7 @@ def create_team(request):
                 logo = logo["secure_url"]
             team = Team.objects.create(name=name, leader=leader, description=description, logo=logo)
             team.member.add(request.user)  # Auto-add the creator as a member
+            refresh_team_points([team.id])
             messages.success(request, 'Team created successfully.')
             return redirect('team_detail', team_id=team.id)
     else:
@@ -122,9 +237,10 @@ def join_team(request):
         if form.is_valid():
             team_id = form.cleaned_data['team_id']
             team = get_object_or_404(Team, id=team_id)
-            # Check if the user is already in a team
-            if not request.user.team_member.exists():
-                team.member.add(request.user)
+            # Check if the user is already in a team, straight on the membership table
+            if not Team.member.through.objects.filter(customuser=request.user).exists():
+                Team.member.through.objects.create(team=team, customuser=request.user)
+                refresh_team_points([team.id])
                 messages.success(request, 'You have joined the team.')
             else:
                 messages.error(request, 'You are already in a team.')
@@ -137,10 +253,9 @@ def leave_team(request, team_id):
     if not request.user.is_authenticated:
         return redirect('send-login-link')
     if request.method == 'POST':
-        team = get_object_or_404(Team, id=team_id)
-        # Check if the user is a member of the team
-        if request.user in team.member.all():
-            team.member.remove(request.user)
+        # deleting the membership row is the check, other members are never loaded
+        if Team.member.through.objects.filter(team_id=team_id, customuser=request.user).delete()[0]:
+            refresh_team_points([team_id])
             messages.success(request, 'You have left the team.')
         else:
             messages.error(request, 'You are not a member of this team.')
@@ -152,10 +267,20 @@ def leave_team(request, team_id):
 def team_detail(request, team_id):
     if not request.user.is_authenticated:
         return redirect('send-login-link')
-    # check if request user is in any team
+    team = Team.objects.select_related('leader').get(id=team_id)
+    members = list(team.member.all())
+    # check if request user is in any team, and in this one
     has_a_team = Team.objects.filter(member=request.user).exists()
-    team = Team.objects.get(id=team_id)
-    return render(request, 'team_detail.html', {'team': team, 'has_a_team': has_a_team})
+    is_member = any(member.id == request.user.id for member in members)
+    # rank history comes from the closed months' snapshots
+    rank_history = reversed(team.score_snapshots.filter(leaderboard__isnull=True).order_by('-month')[:6])
+    return render(request, 'team_detail.html', {
+        'team': team,
+        'members': members,
+        'rank_history': list(rank_history),
+        'has_a_team': has_a_team,
+        'is_member': is_member,
+    })
 
 
 def edit_team(request, team_id):
@@ -165,6 +290,8 @@ def edit_team(request, team_id):
         if request.POST.get('delete'):
             team = Team.objects.get(id=team_id)
             team.delete()
+            update_team_rankings()
+            invalidate_leaderboards()
             return redirect('list_teams')
         else:
             team = Team.objects.get(id=team_id)
@@ -174,6 +301,7 @@ def edit_team(request, team_id):
                 team.logo = logo["secure_url"]
             team.description = request.POST.get('description')
             team.save()
+            invalidate_leaderboards()
             return redirect('team_detail', team_id=team_id)
     else:
         team = Team.objects.get(id=team_id)
@@ -5,5 +5,7 @@ from . import views
 
 urlpatterns = [
     path("", views.notifications, name="notifications"),
+    path("more/", views.more_notifications, name="more_notifications"),
+    path("events/", views.events, name="events"),
     path("dismiss/<int:notification_id>/", views.dismiss_notification, name="dismiss_notification"),
 ]
\ No newline at end of file
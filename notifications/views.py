@@ -1,19 +1,64 @@
+import asyncio
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from engage.models import Notification
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from engage.events import subscribe, unsubscribe
+from engage.notifications import visible_notifications, notifications_page, mark_delivered_read, dismiss
 
 # Create your views here.
 def notifications(request):
     if not request.user.is_authenticated:
         return redirect('send-login-link')
-    user_notifications = request.user.notifications.all().order_by('-created_at')
-    # mark all notifications as read
-    user_notifications.update(read=True)
-    return render(request, 'notifications.html', {'notifications': user_notifications})
+    # newest page of personal notifications and broadcasts, older ones load through htmx
+    user_notifications, has_more = notifications_page(request.user)
+    mark_delivered_read(request.user, user_notifications)
+    return render(request, 'notifications.html', {'notifications': user_notifications, 'has_more': has_more})
+
+def more_notifications(request):
+    if not request.user.is_authenticated:
+        return redirect('send-login-link')
+    before_id = request.GET.get('before_id')
+    user_notifications, has_more = notifications_page(
+        request.user,
+        parse_datetime(request.GET.get('before', '')),
+        int(before_id) if before_id and before_id.isdigit() else None,
+    )
+    mark_delivered_read(request.user, user_notifications)
+    return render(request, 'partials/notifications_page.html', {'notifications': user_notifications, 'has_more': has_more})
 
 def dismiss_notification(request, notification_id):
     if not request.user.is_authenticated:
         return redirect('send-login-link')
-    notification = get_object_or_404(Notification, id=notification_id)
-    notification.delete()
-    return redirect('notifications')
\ No newline at end of file
+    notification = get_object_or_404(visible_notifications(request.user), id=notification_id)
+    dismiss(request.user, notification)
+    return redirect('notifications')
+
+# comment lines keep idle streams from being closed by proxies
+EVENTS_KEEPALIVE = 25
+
+async def event_stream(user_id):
+    queue = subscribe(user_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        unsubscribe(user_id, queue)
+
+async def events(request):
+    # server-sent events with unread count changes, new notifications and leaderboard updates
+    user = await request.auser()
+    # under WSGI (runserver) an endless stream would hold a worker thread forever, a 204
+    # tells the browser not to reconnect
+    if not user.is_authenticated or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    return StreamingHttpResponse(
+        event_stream(user.id),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
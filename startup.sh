@@ -3,5 +3,27 @@ python manage.py migrate
 sqlite3 /data/db.sqlite3 'PRAGMA journal_mode=WAL;'
 sqlite3 /data/db.sqlite3 'PRAGMA synchronous=1;'
 python manage.py collectstatic --noinput
-gunicorn --bind :8000 --workers 2 engage.wsgi
+# background jobs: expire finished activities and close last month's leaderboard once it's over
+# every minute, purge stale login tokens and relayed live events hourly, and once a day purge
+# old notifications and report balances that drifted from the points ledger (fixing them is left to a person)
+(minutes=0
+while true; do
+    python manage.py expire_activities
+    python manage.py close_month
+    if [ $((minutes % 60)) -eq 0 ]; then
+        python manage.py purge_login_tokens
+        python manage.py purge_live_events
+    fi
+    if [ $((minutes % 1440)) -eq 0 ]; then
+        python manage.py purge_notifications
+        python manage.py reconcile_points
+    fi
+    minutes=$((minutes + 1))
+    sleep 60
+done) &
+# outbound emails are sent by their own worker so requests never wait on the provider
+(while true; do python manage.py send_outbox; sleep 5; done) &
+# ASGI so the live event streams don't tie up a worker each; events reach every worker
+# through the database (engage/events.py)
+gunicorn --bind :8000 --workers 2 --worker-class uvicorn.workers.UvicornWorker engage.asgi
 